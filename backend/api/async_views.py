@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from foodgram.metrics import record_queries
+from foodgram.settings import ASYNC_ROUTES, ASYNC_THREADS
+
+executor = ThreadPoolExecutor(ASYNC_THREADS,
+                              thread_name_prefix='foodgram-async')
+
+
+def render(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        with record_queries():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    run = sync_to_async(render, thread_sensitive=False, executor=executor)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+    return wrapper
+
+
+def async_urls(urls):
+    for url in urls:
+        if getattr(url, 'name', None) in ASYNC_ROUTES:
+            url.callback = async_view(url.callback)
+    return urls
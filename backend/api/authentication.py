@@ -0,0 +1,104 @@
+import threading
+from collections import Counter, OrderedDict
+from copy import copy
+from time import monotonic
+
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import (bump_generation, cache_is_shared, get_cache,
+                       get_generation)
+from foodgram.settings import (AUTH_CACHE_SHARED, AUTH_CACHE_SIZE,
+                               AUTH_CACHE_TIMEOUT)
+
+GENERATION = 'auth_tokens'
+
+
+class TokenCache:
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = Counter()
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, entry_generation, expires = entry
+            if entry_generation != generation or expires < monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation):
+        with self.lock:
+            self.entries[key] = (value, generation,
+                                 monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.stats['invalidations'] += len(self.entries)
+            self.entries.clear()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+
+token_cache = TokenCache(AUTH_CACHE_SIZE, AUTH_CACHE_TIMEOUT)
+
+
+def shared_key(key, generation):
+    return f'auth:{generation}:{key}'
+
+
+def drop_tokens():
+    token_cache.clear()
+    bump_generation(GENERATION)
+
+
+def invalidate_tokens():
+    drop_tokens()
+    # До коммита параллельный запрос ещё видит токен и может снова
+    # закэшировать его под новым поколением
+    transaction.on_commit(drop_tokens)
+
+
+def auth_cache_stats():
+    with token_cache.lock:
+        values = dict(token_cache.stats, size=len(token_cache.entries))
+    return [(f'auth_cache_{name}', {}, value)
+            for name, value in sorted(values.items())]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        if not cache_is_shared():
+            # Поколение в локальном кэше не видно другим воркерам, и
+            # отозванный в них токен продолжал бы работать
+            return super().authenticate_credentials(key)
+        generation = get_generation(GENERATION)
+        cached = token_cache.get(key, generation)
+        if cached is None and AUTH_CACHE_SHARED:
+            cached = get_cache().get(shared_key(key, generation))
+            if cached is not None:
+                token_cache.set(key, cached, generation)
+        if cached is None:
+            token_cache.count('misses')
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached, generation)
+            if AUTH_CACHE_SHARED:
+                get_cache().set(shared_key(key, generation), cached,
+                                timeout=AUTH_CACHE_TIMEOUT)
+        else:
+            token_cache.count('hits')
+        user, token = cached
+        return copy(user), token
@@ -0,0 +1,198 @@
+import threading
+from collections import Counter
+from hashlib import sha1
+from time import sleep, time_ns
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.settings import (REFERENCE_CACHE_ALIAS,
+                               REFERENCE_CACHE_MAX_AGE,
+                               REFERENCE_CACHE_TIMEOUT,
+                               RESPONSE_CACHE_LOCK_TIMEOUT,
+                               RESPONSE_CACHE_TIMEOUT,
+                               RESPONSE_CACHE_WAIT)
+
+response_stats = Counter()
+response_stats_lock = threading.Lock()
+
+
+def query_fingerprint(query_params, exclude=()):
+    query = urlencode(sorted(
+        (key, value) for key, values in query_params.lists()
+        for value in values if key not in exclude))
+    return sha1(query.encode()).hexdigest()
+
+
+def get_cache():
+    return caches[REFERENCE_CACHE_ALIAS]
+
+
+def cache_is_shared():
+    # Инвалидация через поколения видна всем процессам только в общем кэше
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def generation_key(name):
+    return f'reference:{name}:generation'
+
+
+def get_generation(name):
+    cache = get_cache()
+    generation = cache.get(generation_key(name))
+    if generation is None:
+        cache.add(generation_key(name), time_ns(), timeout=None)
+        generation = cache.get(generation_key(name))
+    return generation
+
+
+def bump_generation(name):
+    cache = get_cache()
+    try:
+        return cache.incr(generation_key(name))
+    except ValueError:
+        cache.add(generation_key(name), time_ns(), timeout=None)
+        return None
+
+
+class CachedReferenceMixin:
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        if not cache_is_shared():
+            return super().list(request, *args, **kwargs)
+        cache = get_cache()
+        key = 'reference:{}:{}:{}'.format(
+            self.reference_name, get_generation(self.reference_name),
+            query_fingerprint(request.query_params))
+        cached = cache.get(key)
+        if cached is None:
+            data = super().list(request, *args, **kwargs).data
+            body = JSONRenderer().render(data)
+            cached = (body, quote_etag(sha1(body).hexdigest()))
+            cache.set(key, cached, timeout=REFERENCE_CACHE_TIMEOUT)
+        body, etag = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True,
+                            max_age=REFERENCE_CACHE_MAX_AGE)
+        return response
+
+
+def tag_key(tag):
+    return f'response:tag:{tag}'
+
+
+def tag_versions(tags, initial):
+    cache = get_cache()
+    keys = [tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial, timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def invalidate_response_tags(*tags):
+    transaction.on_commit(lambda: get_cache().set_many(
+        {tag_key(tag): time_ns() for tag in tags}, timeout=None))
+
+
+def count_response(name):
+    with response_stats_lock:
+        response_stats[name] += 1
+
+
+def response_cache_stats():
+    with response_stats_lock:
+        return [(f'response_cache_{name}', {}, value)
+                for name, value in sorted(response_stats.items())]
+
+
+class AnonymousResponseCacheMixin:
+    response_cache_name = None
+
+    def get_cache_tags(self, data):
+        return ()
+
+    def cached_entry(self, key):
+        entry = get_cache().get(key)
+        if entry is None:
+            return None
+        body, etag, versions = entry
+        if get_cache().get_many(versions) != versions:
+            count_response('stale')
+            return None
+        return body, etag
+
+    def recompute(self, key, request, render, *args, **kwargs):
+        cache = get_cache()
+        lock = f'{key}:lock'
+        waited = 0
+        locked = cache.add(lock, 1, timeout=RESPONSE_CACHE_LOCK_TIMEOUT)
+        while not locked and waited < RESPONSE_CACHE_WAIT:
+            count_response('waits')
+            sleep(0.01)
+            waited += 0.01
+            cached = self.cached_entry(key)
+            if cached is not None:
+                count_response('hits')
+                return cached, None
+            locked = cache.add(lock, 1, timeout=RESPONSE_CACHE_LOCK_TIMEOUT)
+        count_response('misses')
+        started = time_ns()
+        try:
+            response = render(request, *args, **kwargs)
+            if response.status_code != 200:
+                return None, response
+            body = JSONRenderer().render(response.data)
+            cached = (body, quote_etag(sha1(body).hexdigest()))
+            versions = tag_versions(self.get_cache_tags(response.data),
+                                    started - 1)
+            if all(version < started for version in versions.values()):
+                cache.set(key, (*cached, versions),
+                          timeout=RESPONSE_CACHE_TIMEOUT)
+            return cached, None
+        finally:
+            if locked:
+                cache.delete(lock)
+
+    def cached_response(self, request, render, *args, **kwargs):
+        if request.user.is_authenticated or not cache_is_shared():
+            return render(request, *args, **kwargs)
+        key = 'response:{}:{}:{}'.format(
+            self.response_cache_name, self.action, sha1('{}|{}|{}'.format(
+                request.get_host(), kwargs.get(self.lookup_field, ''),
+                query_fingerprint(request.query_params)).encode(),
+            ).hexdigest())
+        cached = self.cached_entry(key)
+        if cached is not None:
+            count_response('hits')
+        else:
+            cached, response = self.recompute(key, request, render,
+                                              *args, **kwargs)
+            if cached is None:
+                return response
+        body, etag = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve,
+                                    *args, **kwargs)
@@ -0,0 +1,70 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from recipes.models import ShoppingCartTotal
+from recipes.units import normalize_totals
+from users.models import User
+
+CHUNK_SIZE = 500
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_totals(user):
+    return ShoppingCartTotal.objects.filter(user=user).order_by(
+        'ingredient__name').values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+        'ingredient__density').iterator(chunk_size=CHUNK_SIZE)
+
+
+def render_txt(rows):
+    yield 'Список покупок:\n'
+    for name, measure, amount in rows:
+        yield f'- {name} в количестве: {amount} {measure},\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for name, measure, amount in rows:
+        yield writer.writerow((name, amount, measure))
+
+
+EXPORT_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def shopping_cart_response(request, file_format):
+    render, content_type = EXPORT_FORMATS[file_format]
+    # request.user может быть копией из кэша токенов, поэтому отметка
+    # изменения итогов читается из базы
+    modified = User.objects.filter(id=request.user.id).values_list(
+        'cart_modified', flat=True).first()
+    etag = quote_etag('{}-{}-{}'.format(
+        request.user.id, file_format,
+        modified.timestamp() if modified else 0))
+    last_modified = modified.timestamp() if modified else None
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    response = StreamingHttpResponse(
+        render(normalize_totals(shopping_cart_totals(request.user))),
+        content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{file_format}"')
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,101 @@
+from functools import lru_cache
+from threading import Lock
+
+from django.utils.module_loading import import_string
+
+from api.cache import cache_is_shared, get_cache
+from foodgram.settings import (FEED_FANOUT_MAX_FOLLOWERS, FEED_LENGTH,
+                               FEED_STORE, FEED_TIMEOUT)
+from recipes.models import Recipe
+from users.models import Subscription, User
+
+
+class LocalTimelineStore:
+
+    def __init__(self):
+        self._lock = Lock()
+        self._timelines = {}
+
+    def get(self, user_id):
+        with self._lock:
+            timeline = self._timelines.get(user_id)
+            return None if timeline is None else list(timeline)
+
+    def set(self, user_id, recipe_ids):
+        with self._lock:
+            self._timelines[user_id] = list(recipe_ids[:FEED_LENGTH])
+
+    def push(self, user_ids, recipe_id):
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self._timelines.get(user_id)
+                if timeline is not None:
+                    timeline.insert(0, recipe_id)
+                    del timeline[FEED_LENGTH:]
+
+    def delete(self, user_id):
+        with self._lock:
+            self._timelines.pop(user_id, None)
+
+
+class CacheTimelineStore:
+
+    @staticmethod
+    def key(user_id):
+        return f'feed:{user_id}'
+
+    def get(self, user_id):
+        if not cache_is_shared():
+            return None
+        return get_cache().get(self.key(user_id))
+
+    def set(self, user_id, recipe_ids):
+        if not cache_is_shared():
+            return
+        get_cache().set(self.key(user_id), list(recipe_ids[:FEED_LENGTH]),
+                        timeout=FEED_TIMEOUT)
+
+    def push(self, user_ids, recipe_id):
+        # Чтение и запись списка в общем кэше не атомарны, и при
+        # одновременных публикациях одна из них терялась бы; лента
+        # сбрасывается и пересобирается из базы при следующем чтении
+        get_cache().delete_many([self.key(user_id) for user_id in user_ids])
+
+    def delete(self, user_id):
+        get_cache().delete(self.key(user_id))
+
+
+@lru_cache(maxsize=None)
+def get_timeline_store():
+    return import_string(FEED_STORE)()
+
+
+def publish_recipe(recipe):
+    if User.objects.filter(
+            id=recipe.author_id,
+            followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS).exists():
+        return
+    get_timeline_store().push(list(Subscription.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)),
+        recipe.id)
+
+
+def invalidate_timeline(user):
+    get_timeline_store().delete(user.id)
+
+
+def get_timeline(user):
+    store = get_timeline_store()
+    recipe_ids = store.get(user.id)
+    if recipe_ids is None:
+        recipe_ids = list(Recipe.objects.filter(
+            author__subscriber__user=user).order_by('-id').values_list(
+            'id', flat=True)[:FEED_LENGTH])
+        store.set(user.id, recipe_ids)
+    popular_authors = Subscription.objects.filter(
+        user=user,
+        author__followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS).values(
+        'author_id')
+    pulled = Recipe.objects.filter(author_id__in=popular_authors).order_by(
+        '-id').values_list('id', flat=True)[:FEED_LENGTH]
+    return sorted(set(recipe_ids).union(pulled), reverse=True)[:FEED_LENGTH]
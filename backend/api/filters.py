@@ -1,14 +1,25 @@
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
 
+from api.cache import cache_is_shared
+from api.search import ingredient_index, sql_search
 from users.models import User
 from recipes.models import Recipe
+from recipes.search import search_recipes
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param)
+        if not name or view.action != 'list':
+            return queryset
+        if not cache_is_shared():
+            return sql_search(name)
+        return ingredient_index.search(name)
+
 
 class RecipesFilter(FilterSet):
     tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
@@ -17,6 +28,7 @@ class RecipesFilter(FilterSet):
         method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     def is_favorited_or_in_cart(self, queryset, name, value, related_model):
         return queryset.filter(**{f'{related_model}__user':
@@ -30,6 +42,10 @@ class RecipesFilter(FilterSet):
         return self.is_favorited_or_in_cart(queryset, name,
                                             value, 'shoppingcarts')
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
@@ -1,15 +1,69 @@
 import base64
+import binascii
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
-from rest_framework.serializers import ImageField
+from django.core.files import File
+from PIL import Image
+from rest_framework.serializers import ImageField, ValidationError
+
+from foodgram.settings import IMAGE_MAX_PIXELS, IMAGE_MAX_SIZE
+
+DECODE_CHUNK = 64 * 1024
+
+
+def decode_base64(imgstr):
+    if len(imgstr) * 3 // 4 > IMAGE_MAX_SIZE:
+        raise ValidationError('Изображение слишком большое.')
+    file = SpooledTemporaryFile(max_size=DECODE_CHUNK * 16)
+    try:
+        for start in range(0, len(imgstr), DECODE_CHUNK):
+            chunk = base64.b64decode(imgstr[start:start + DECODE_CHUNK],
+                                     validate=True)
+            if not start:
+                check_dimensions(chunk)
+            file.write(chunk)
+    except (binascii.Error, ValueError):
+        file.close()
+        raise ValidationError('Некорректные данные изображения.')
+    file.seek(0)
+    return file
+
+
+def check_dimensions(header):
+    try:
+        width, height = Image.open(BytesIO(header)).size
+    except Exception:
+        return
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большое разрешение изображения.')
 
 
 class Base64ImageField(ImageField):
 
+    def __init__(self, *args, rendition=None, list_rendition=None, **kwargs):
+        self.rendition = rendition
+        self.list_rendition = list_rendition or rendition
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = File(decode_base64(imgstr), name='temp.' + ext)
 
         return super().to_internal_value(data)
+
+    def to_representation(self, value):
+        view = self.context.get('view')
+        rendition = (self.list_rendition
+                     if getattr(view, 'action', None) == 'list'
+                     else self.rendition)
+        if not value or not rendition or not hasattr(value.storage,
+                                                     'rendition_url'):
+            return super().to_representation(value)
+        url = value.storage.rendition_url(value.name, rendition)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
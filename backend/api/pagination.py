@@ -1,13 +1,67 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
 
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
-from foodgram.settings import PAGE_SIZE
+
+from api.cache import get_cache, query_fingerprint
+from foodgram.settings import CURSOR_COUNT_CACHE_TIMEOUT, PAGE_SIZE
 
 
 class CustomRecipesPagination(PageNumberPagination):
     page_size = PAGE_SIZE
 
 
+class LimitCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    page_size = PAGE_SIZE
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
 class CustomUsersPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering is None or not hasattr(queryset, 'order_by') or (
+                self.cursor_query_param not in request.query_params):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_pagination = LimitCursorPagination(ordering)
+        self.count = self.get_approximate_count(queryset, request, view)
+        return self.cursor_pagination.paginate_queryset(
+            queryset, request, view)
+
+    def get_approximate_count(self, queryset, request, view):
+        if CURSOR_COUNT_CACHE_TIMEOUT is None:
+            return None
+        query = query_fingerprint(
+            request.query_params,
+            exclude=(self.cursor_query_param, self.page_size_query_param))
+        user = request.user.id if request.user.is_authenticated else None
+        key = f'pagination:count:{view.basename}:{view.action}:{user}:{query}'
+        cache = get_cache()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, timeout=CURSOR_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is None:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.cursor_pagination.get_next_link()),
+            ('previous', self.cursor_pagination.get_previous_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,44 @@
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+RELATED_FIELDS = {
+    Favorite: 'recipe_id',
+    ShoppingCart: 'recipe_id',
+    Subscription: 'author_id',
+}
+
+
+class RelationshipContext:
+
+    def __init__(self, user):
+        self.user = user
+        self._known = {model: {} for model in RELATED_FIELDS}
+
+    def prime(self, model, ids):
+        known = self._known[model]
+        missing = set(ids) - known.keys()
+        if not missing:
+            return
+        field = RELATED_FIELDS[model]
+        found = set(model.objects.filter(
+            user=self.user, **{f'{field}__in': missing}).values_list(
+            field, flat=True))
+        for pk in missing:
+            known[pk] = pk in found
+
+    def has(self, model, pk):
+        if pk not in self._known[model]:
+            self.prime(model, (pk,))
+        return self._known[model][pk]
+
+    def invalidate(self, model=None):
+        for key in ((model,) if model else self._known):
+            self._known[key].clear()
+
+
+def get_relationships(request):
+    relationships = getattr(request, 'relationships', None)
+    if relationships is None or relationships.user != request.user:
+        relationships = RelationshipContext(request.user)
+        request.relationships = relationships
+    return relationships
@@ -0,0 +1,137 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.db.models import Case, Count, F, FloatField, Q, When
+from django.db.models.functions import Cast
+
+from api.cache import bump_generation, get_generation
+from recipes.models import Ingredient, RecipeIngredientAmount
+
+
+def sql_search(query):
+    query = query.strip()
+    return Ingredient.objects.filter(name__icontains=query).order_by(
+        Case(When(name__istartswith=query, then=0), default=1), 'name')
+
+
+def sql_rank(ingredient_ids):
+    return list(RecipeIngredientAmount.objects.values('recipe').annotate(
+        total=Count('id'),
+        hits=Count('id', filter=Q(ingredient_id__in=ingredient_ids)),
+    ).filter(hits__gt=0).annotate(
+        coverage=Cast(F('hits'), FloatField()) / F('total'),
+    ).order_by('-coverage', '-hits', '-recipe').values_list(
+        'recipe', 'coverage'))
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._keys = None
+        self._items = None
+
+    def _load(self):
+        generation = get_generation('ingredients')
+        with self._lock:
+            if self._keys is None or self._generation != generation:
+                rows = sorted(
+                    (name.casefold(), pk, name, measurement_unit)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit').iterator())
+                self._items = [Ingredient(id=pk, name=name,
+                                          measurement_unit=unit)
+                               for _, pk, name, unit in rows]
+                self._keys = [row[0] for row in rows]
+                self._generation = generation
+            return self._keys, self._items
+
+    def search(self, query):
+        keys, items = self._load()
+        query = query.strip().casefold()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        contains = [item for index, (key, item) in enumerate(zip(keys, items))
+                    if query in key and not start <= index < end]
+        return items[start:end] + contains
+
+
+class RecipeIngredientIndex:
+    generation_name = 'recipe_ingredients'
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._postings = None
+        self._sizes = None
+
+    def _build(self):
+        postings = defaultdict(lambda: array('q'))
+        sizes = Counter()
+        for ingredient_id, recipe_id in (
+                RecipeIngredientAmount.objects.order_by(
+                    'ingredient_id', 'recipe_id').values_list(
+                    'ingredient_id', 'recipe_id').iterator()):
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self._postings, self._sizes = postings, sizes
+
+    def _load(self, generation):
+        if self._postings is None or self._generation != generation:
+            self._build()
+            self._generation = generation
+
+    def _remove(self, recipe_id):
+        for recipe_ids in self._postings.values():
+            position = bisect_left(recipe_ids, recipe_id)
+            if (position < len(recipe_ids)
+                    and recipe_ids[position] == recipe_id):
+                del recipe_ids[position]
+        self._sizes.pop(recipe_id, None)
+
+    def _apply(self, change):
+        with self._lock:
+            generation = bump_generation(self.generation_name)
+            if self._postings is None or generation is None or (
+                    generation != self._generation + 1):
+                self._postings = None
+                return
+            change()
+            self._generation = generation
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        def change():
+            self._remove(recipe_id)
+            for ingredient_id in set(ingredient_ids):
+                insort(self._postings[ingredient_id], recipe_id)
+            self._sizes[recipe_id] = len(set(ingredient_ids))
+        self._apply(change)
+
+    def remove_recipe(self, recipe_id):
+        self._apply(lambda: self._remove(recipe_id))
+
+    def rank(self, ingredient_ids):
+        generation = get_generation(self.generation_name)
+        hits = Counter()
+        with self._lock:
+            self._load(generation)
+            for ingredient_id in set(ingredient_ids):
+                hits.update(self._postings.get(ingredient_id, ()))
+            coverage = [(recipe_id, count / self._sizes[recipe_id])
+                        for recipe_id, count in hits.items()
+                        if self._sizes.get(recipe_id)]
+        return sorted(coverage,
+                      key=lambda item: (item[1], hits[item[0]], item[0]),
+                      reverse=True)
+
+
+ingredient_index = IngredientIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
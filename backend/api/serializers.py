@@ -1,15 +1,24 @@
+from django.db import transaction
+from django.db.models import F
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
 
 from api.images import Base64ImageField
-from api.utils import check_subscribed
-from users.models import User
+from api.relationships import get_relationships
+from api.search import recipe_ingredient_index
+from api.utils import check_subscribed, get_recipes_limit
+from foodgram.settings import BATCH_MAX_SIZE
+from recipes import cart_totals
+from recipes.search import update_search_vector
+from users.models import Subscription, User
 from recipes.models import (Favorite,
                             Ingredient,
+                            Job,
                             Recipe,
                             RecipeIngredientAmount,
                             ShoppingCart,
+                            ShoppingCartTotal,
                             Tag)
 
 
@@ -51,6 +60,39 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RelationshipListSerializer(serializers.ListSerializer):
+    related_models = ()
+
+    def authors(self, items):
+        return items
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated and items:
+            relationships = get_relationships(request)
+            for model, annotation in self.related_models:
+                if not hasattr(items[0], annotation):
+                    relationships.prime(model, [item.id for item in items])
+            authors = self.authors(items)
+            if not hasattr(authors[0], 'is_subscribed'):
+                relationships.prime(Subscription,
+                                    [author.id for author in authors])
+        return super().to_representation(items)
+
+
+class UsersListSerializer(RelationshipListSerializer):
+    pass
+
+
+class RecipeListSerializer(RelationshipListSerializer):
+    related_models = ((Favorite, 'is_favorited'),
+                      (ShoppingCart, 'is_in_shopping_cart'))
+
+    def authors(self, items):
+        return [item.author for item in items]
+
+
 class UsersSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -61,33 +103,39 @@ class UsersSerializer(UserSerializer):
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed')
+        list_serializer_class = UsersListSerializer
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     author = UsersSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(many=True, source='recipes')
     tags = TagSerializer(many=True)
-    image = Base64ImageField()
+    image = Base64ImageField(rendition='full', list_rendition='card')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
-    def get_is_favorited_or_in_cart(self, obj, model):
+    def get_is_favorited_or_in_cart(self, obj, model, annotation):
         request = self.context.get('request')
         user = request.user
         if request and user.is_authenticated:
-            return model.objects.filter(user=user, recipe=obj).exists()
+            if hasattr(obj, annotation):
+                return getattr(obj, annotation)
+            return get_relationships(request).has(model, obj.id)
 
     def get_is_favorited(self, obj):
-        return self.get_is_favorited_or_in_cart(obj, Favorite)
+        return self.get_is_favorited_or_in_cart(obj, Favorite,
+                                                'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.get_is_favorited_or_in_cart(obj, ShoppingCart)
+        return self.get_is_favorited_or_in_cart(obj, ShoppingCart,
+                                                'is_in_shopping_cart')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'name', 'image', 'text',
                   'ingredients', 'cooking_time',
                   'is_favorited', 'is_in_shopping_cart')
+        list_serializer_class = RecipeListSerializer
 
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -110,34 +158,84 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = '__all__'
 
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if not ids:
+            raise serializers.ValidationError('Нужен минимум один ингредиент')
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться')
+        if any(ingredient['amount'] < 1 for ingredient in ingredients):
+            raise serializers.ValidationError(
+                'Количество ингредиента должно быть больше нуля')
+        missing = set(ids) - set(Ingredient.objects.in_bulk(ids))
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}')
+        return ingredients
+
     @staticmethod
-    def save_ingredients(recipe, ingredients):
+    def save_ingredients(recipe, ingredients, current=None):
+        amounts = {ingredient['id']: ingredient['amount']
+                   for ingredient in ingredients}
+        if current is not None:
+            deltas = {ingredient_id: amount for ingredient_id, amount
+                      in amounts.items()}
+            for ingredient_id, row in current.items():
+                deltas[ingredient_id] = (deltas.get(ingredient_id, 0)
+                                         - (row.amount or 0))
+            cart_totals.change_recipe(recipe.id, deltas)
+        current = current or {}
+        changed = []
+        for ingredient_id, row in current.items():
+            if ingredient_id in amounts and row.amount != amounts[
+                    ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                changed.append(row)
+        removed = [row.id for ingredient_id, row in current.items()
+                   if ingredient_id not in amounts]
+        if removed:
+            RecipeIngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredientAmount.objects.bulk_update(changed, ['amount'])
         RecipeIngredientAmount.objects.bulk_create(
             [RecipeIngredientAmount(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
+                ingredient_id=ingredient_id,
+                amount=amount
+            ) for ingredient_id, amount in amounts.items()
+                if ingredient_id not in current]
         )
+        transaction.on_commit(
+            lambda: recipe_ingredient_index.update_recipe(
+                recipe.id, list(amounts)))
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.save_ingredients(recipe, ingredients)
+        User.objects.filter(id=recipe.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+        update_search_vector(Recipe.objects.filter(id=recipe.id))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.save_ingredients(instance, ingredients)
+            current = {row.ingredient_id: row
+                       for row in instance.recipes.select_for_update()}
+            self.save_ingredients(instance, validated_data.pop('ingredients'),
+                                  current)
         if 'tags' in validated_data:
             instance.tags.set(
                 validated_data.pop('tags'))
-        return super().update(
+        instance = super().update(
             instance, validated_data)
+        update_search_vector(Recipe.objects.filter(id=instance.id))
+        return instance
 
     def to_representation(self, instance):
         context = {'request': self.context.get('request')}
@@ -145,13 +243,38 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = Base64ImageField(rendition='thumbnail')
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class ShoppingCartTotalSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'error',
+                  'created', 'started_at', 'finished_at', 'duration')
+
+
+class IdListSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_SIZE)
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -166,13 +289,11 @@ class ShoppingCartSerializer(FavoriteSerializer):
 
 
 class BaseUserSerializer(serializers.ModelSerializer):
-    recipes = RecipeSerializer(many=True, read_only=True)
+    recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.BooleanField(
         default=serializers.CurrentUserDefault()
     )
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -184,17 +305,22 @@ class BaseUserSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.id, [])
+        else:
+            limit = get_recipes_limit(request)
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:limit]
+        serializer = RecipeShortSerializer(recipes, many=True, read_only=True,
+                                           context={'request': request})
         return serializer.data
 
 
 class SubscriptionsSerializer(BaseUserSerializer):
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class SubscribeSerializer(BaseUserSerializer):
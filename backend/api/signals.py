@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import auth_cache_stats, invalidate_tokens
+from api.cache import (bump_generation, invalidate_response_tags,
+                       response_cache_stats)
+from api.search import recipe_ingredient_index
+from foodgram.metrics import register_collector
+from recipes.jobs import job_stats
+from recipes.models import Ingredient, Recipe, RecipeIngredientAmount, Tag
+from recipes.search import update_search_vector
+from users.models import User
+
+register_collector(auth_cache_stats)
+register_collector(response_cache_stats)
+register_collector(job_stats)
+
+
+# Поколение меняется после коммита: иначе параллельный запрос успел бы
+# закэшировать под новым поколением ещё старые строки
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(lambda: bump_generation('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_generation('tags'))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_recipes(instance, created, **kwargs):
+    # Названия ингредиентов входят в search_vector рецептов
+    if not created:
+        transaction.on_commit(lambda: update_search_vector(
+            Recipe.objects.filter(ingredients=instance.id)))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.remove_recipe(recipe_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(**kwargs):
+    invalidate_tokens()
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_tokens(instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_tokens()
+        invalidate_response_tags(f'user:{instance.id}')
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(instance, created, **kwargs):
+    invalidate_response_tags(f'recipe:{instance.id}', 'recipes:search',
+                             *(('recipes',) if created else ()))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(instance, **kwargs):
+    invalidate_response_tags(f'recipe:{instance.id}', 'recipes')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_response_tags(f'recipe:{instance.id}', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredientAmount)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_response_tags(f'recipe:{instance.recipe_id}',
+                             'recipes:search')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_responses(instance, **kwargs):
+    invalidate_response_tags(f'tag:{instance.id}', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_responses(instance, **kwargs):
+    invalidate_response_tags(f'ingredient:{instance.id}', 'recipes:search')
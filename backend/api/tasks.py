@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from api.exports import EXPORT_FORMATS, shopping_cart_totals
+from foodgram.settings import JOB_BATCH_SIZE
+from recipes import cart_totals
+from recipes.models import (Favorite, Job, Recipe, ShoppingCart,
+                            ShoppingCartTotal)
+from recipes.units import normalize_totals
+from users.models import Subscription, User
+
+
+def export_shopping_cart(job, file_format):
+    render, _ = EXPORT_FORMATS[file_format]
+    content = ''.join(render(normalize_totals(
+        shopping_cart_totals(job.user))))
+    Job.objects.filter(id=job.id).update(output=content.encode())
+    return {'file_format': file_format,
+            'download': reverse('jobs-download', args=(job.id,))}
+
+
+def delete_in_batches(queryset):
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('id', flat=True)[:JOB_BATCH_SIZE])
+            if not ids:
+                return
+            queryset.model.objects.filter(id__in=ids).delete()
+
+
+def delete_counted(queryset, field, target, **updates):
+    counter = queryset.model.counter_field
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.values_list(
+                'id', f'{field}_id')[:JOB_BATCH_SIZE])
+            if not rows:
+                return
+            queryset.model.objects.filter(
+                id__in=[pk for pk, _ in rows]).delete()
+            target.objects.filter(
+                id__in=[target_id for _, target_id in rows],
+                **{f'{counter}__gt': 0}).update(
+                **{counter: F(counter) - 1}, **updates)
+
+
+def delete_user(job, user_id):
+    if not User.objects.filter(id=user_id).exists():
+        return {'deleted': False}
+    for model in (Favorite, ShoppingCart):
+        delete_counted(model.objects.filter(user_id=user_id), 'recipe',
+                       Recipe, modified=timezone.now())
+    delete_counted(Subscription.objects.filter(user_id=user_id), 'author',
+                   User)
+    ShoppingCartTotal.objects.filter(user_id=user_id).delete()
+    for recipe in Recipe.objects.filter(author_id=user_id).only('id'):
+        with transaction.atomic():
+            cart_totals.remove_recipe_everywhere(recipe.id)
+            recipe.delete()
+    delete_in_batches(Subscription.objects.filter(author_id=user_id))
+    User.objects.filter(id=user_id).delete()
+    return {'deleted': True}
@@ -0,0 +1,423 @@
+import tempfile
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.async_views import async_view
+from api.authentication import GENERATION, token_cache
+from api.cache import bump_generation, get_generation
+from api.search import IngredientIndex
+from api.feed import (get_timeline, get_timeline_store, invalidate_timeline,
+                      publish_recipe)
+from api.tasks import delete_user
+from foodgram.metrics import QueryRecorder, query_recorder
+from foodgram.settings import FEED_FANOUT_MAX_FOLLOWERS
+from recipes.jobs import claim_jobs, enqueue, run_job
+from recipes.models import (Favorite, Ingredient, Job, Recipe,
+                            RecipeIngredientAmount, ShoppingCartTotal, Tag)
+from users.models import Subscription, User
+
+SHARED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }
+}
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def me(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_cached_lookup_skips_query(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.me(), 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.me(), 200)
+        self.assertEqual(len(second), len(first) - 1)
+
+    def test_logout_rejects_token_immediately(self):
+        self.assertEqual(self.me(), 200)
+        self.assertEqual(
+            self.client.post('/api/auth/token/logout/').status_code, 204)
+        self.assertEqual(self.me(), 401)
+
+    def test_token_cached_before_commit_is_dropped(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            # Параллельный запрос успел закэшировать ещё видимый токен
+            token_cache.set(self.token.key, (self.user, self.token),
+                            get_generation(GENERATION))
+        self.assertEqual(self.me(), 401)
+
+    def test_revoked_in_other_process(self):
+        self.assertEqual(self.me(), 200)
+        # Другой процесс удаляет токен и поднимает поколение в общем кэше
+        Token.objects.filter(pk=self.token.pk)._raw_delete('default')
+        bump_generation('auth_tokens')
+        self.assertEqual(self.me(), 401)
+
+    def test_password_change_and_deactivation(self):
+        self.assertEqual(self.me(), 200)
+        self.user.set_password('Pass-w0rd-2')
+        self.user.save()
+        self.assertEqual(self.me(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me(), 401)
+
+
+class LocalTokenCacheTest(TestCase):
+    def test_process_local_cache_is_not_used(self):
+        token_cache.clear()
+        user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        Token.objects.filter(pk=token.pk)._raw_delete('default')
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+
+class QueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='Pass-w0rd-1')
+        tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                                   slug=f'tag{i}') for i in range(2)]
+        ingredients = [Ingredient.objects.create(
+            name=f'Продукт {i}', measurement_unit='г') for i in range(3)]
+        for i in range(6):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='Pass-w0rd-1')
+            Subscription.objects.create(user=cls.user, author=author)
+            for j in range(2):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {i}-{j}', text='Текст',
+                    cooking_time=10, image='recipes/images/test.png')
+                recipe.tags.set(tags)
+                RecipeIngredientAmount.objects.bulk_create(
+                    RecipeIngredientAmount(recipe=recipe, ingredient=item,
+                                           amount=100)
+                    for item in ingredients)
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+        cls.author = author
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueries(self, url, expected):
+        for limit in (2, 6):
+            with self.subTest(url=url, limit=limit):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(url, {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list(self):
+        self.assertQueries('/api/recipes/', 6)
+
+    def test_recipe_detail(self):
+        self.assertQueries(f'/api/recipes/{self.recipe.id}/', 5)
+
+    def test_user_list(self):
+        self.assertQueries('/api/users/', 2)
+
+    def test_user_detail(self):
+        self.assertQueries(f'/api/users/{self.author.id}/', 2)
+
+    def test_subscriptions(self):
+        self.assertQueries('/api/users/subscriptions/', 3)
+
+
+class JobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_is_downloaded_by_owner_only(self):
+        response = self.client.post(
+            '/api/recipes/download_shopping_cart/?file_format=csv')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        url = f'/api/jobs/{job_id}/download/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(claim_jobs(1), [job_id])
+        run_job(job_id)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').data[
+            'result']['download'], url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        other = User.objects.create_user(
+            username='other', email='other@example.com',
+            password='Pass-w0rd-1')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_stale_jobs(self):
+        now = timezone.now()
+        old = now - timedelta(hours=1)
+        exhausted, retried, alive = (Job.objects.create(
+            name='api.tasks.delete_user', status=Job.RUNNING,
+            attempts=attempts, started_at=old, heartbeat_at=heartbeat)
+            for attempts, heartbeat in ((3, old), (1, old), (1, now)))
+        self.assertEqual(claim_jobs(10), [retried.id])
+        for job in (exhausted, retried, alive):
+            job.refresh_from_db()
+        self.assertEqual(exhausted.status, Job.FAILED)
+        self.assertEqual((retried.status, retried.attempts),
+                         (Job.RUNNING, 2))
+        self.assertEqual((alive.status, alive.attempts), (Job.RUNNING, 1))
+
+
+class ShoppingCartExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Блины', text='Текст', cooking_time=10)
+        RecipeIngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+
+    def download(self, **headers):
+        return self.client.get('/api/recipes/download_shopping_cart/',
+                               **headers)
+
+    def test_recipe_edit_changes_etag(self):
+        response = self.download()
+        etag = response['ETag']
+        self.assertIn('100', b''.join(response.streaming_content).decode())
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=etag).status_code,
+                         304)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'ingredients': [{'id': self.ingredient.id, 'amount': 250}]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('250', b''.join(response.streaming_content).decode())
+
+
+class AsyncMetricsTest(TestCase):
+    def test_queries_in_executor_threads_are_recorded(self):
+        def view(request):
+            return HttpResponse(str(User.objects.count()))
+
+        recorder = QueryRecorder()
+        token = query_recorder.set(recorder)
+        try:
+            response = async_to_sync(async_view(view))(None)
+        finally:
+            query_recorder.reset(token)
+        self.assertEqual(response.content, b'0')
+        self.assertEqual(recorder.count, 1)
+
+
+class FollowersCountTest(TestCase):
+    def setUp(self):
+        self.author, self.reader = (User.objects.create_user(
+            username=name, email=f'{name}@example.com',
+            password='Pass-w0rd-1') for name in ('author', 'reader'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def followers(self):
+        self.author.refresh_from_db()
+        return self.author.followers_count
+
+    def test_subscribe_updates_counter(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.followers(), 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.followers(), 0)
+        self.client.post('/api/users/subscribe/batch/',
+                         {'ids': [self.author.id]}, format='json')
+        self.assertEqual(self.followers(), 1)
+        run_job(enqueue(delete_user, user_id=self.reader.id).id)
+        self.assertEqual(self.followers(), 0)
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_timeline_fanout_and_pull(self):
+        Subscription.objects.create(user=self.reader, author=self.author)
+        invalidate_timeline(self.reader)
+        self.assertEqual(get_timeline(self.reader), [])
+        pushed = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10)
+        publish_recipe(pushed)
+        self.assertIsNone(get_timeline_store().get(self.reader.id))
+        self.assertEqual(get_timeline(self.reader), [pushed.id])
+        User.objects.filter(id=self.author.id).update(
+            followers_count=FEED_FANOUT_MAX_FOLLOWERS + 1)
+        pulled = Recipe.objects.create(
+            author=self.author, name='Каша', text='Текст', cooking_time=10)
+        publish_recipe(pulled)
+        self.assertEqual(get_timeline_store().get(self.reader.id),
+                         [pushed.id])
+        self.assertEqual(get_timeline(self.reader), [pulled.id, pushed.id])
+
+
+class BatchTest(TestCase):
+    def setUp(self):
+        self.user, self.author = (User.objects.create_user(
+            username=name, email=f'{name}@example.com',
+            password='Pass-w0rd-1') for name in ('cook', 'author'))
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        self.recipes = [Recipe.objects.create(
+            author=self.author, name=f'Рецепт {i}', text='Текст',
+            cooking_time=10) for i in range(2)]
+        for recipe in self.recipes:
+            RecipeIngredientAmount.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, ids):
+        response = getattr(self.client, method)(url, {'ids': ids},
+                                                format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {row['id']: row['status'] for row in response.data['results']}
+
+    def totals(self):
+        return list(ShoppingCartTotal.objects.filter(
+            user=self.user).values_list('amount', flat=True))
+
+    def counters(self, field):
+        return sorted(Recipe.objects.values_list(field, flat=True))
+
+    def test_shopping_cart_batch(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        first, second = (recipe.id for recipe in self.recipes)
+        self.assertEqual(self.batch('post', url, [first, 999]),
+                         {first: 'added', 999: 'not_found'})
+        self.assertEqual(self.batch('post', url, [first, second]),
+                         {first: 'exists', second: 'added'})
+        self.assertEqual(self.totals(), [200])
+        self.assertEqual(self.counters('in_carts_count'), [1, 1])
+        self.assertEqual(self.batch('delete', url, [first, 999]),
+                         {first: 'removed', 999: 'not_found'})
+        self.assertEqual(self.batch('delete', url, [first]),
+                         {first: 'not_found'})
+        self.assertEqual(self.totals(), [100])
+        self.assertEqual(self.counters('in_carts_count'), [0, 1])
+
+    def test_favorite_batch(self):
+        url = '/api/recipes/favorite/batch/'
+        ids = [recipe.id for recipe in self.recipes]
+        self.batch('post', url, ids)
+        self.assertEqual(self.batch('post', url, ids),
+                         dict.fromkeys(ids, 'exists'))
+        self.assertEqual(self.counters('favorites_count'), [1, 1])
+        self.batch('delete', url, ids)
+        self.assertEqual(self.counters('favorites_count'), [0, 0])
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_subscribe_batch(self):
+        url = '/api/users/subscribe/batch/'
+        self.assertEqual(self.batch('post', url, [self.author.id,
+                                                  self.user.id]),
+                         {self.author.id: 'added', self.user.id: 'not_found'})
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.batch('delete', url, [self.author.id]),
+                         {self.author.id: 'removed'})
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_invalid_ids(self):
+        response = self.client.post('/api/recipes/favorite/batch/',
+                                    {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class ReferenceCacheTest(TestCase):
+    def test_generation_is_bumped_after_commit(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/tags/').json(), [])
+        before = get_generation('tags')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast')
+            self.assertEqual(get_generation('tags'), before)
+        self.assertNotEqual(get_generation('tags'), before)
+        self.assertEqual([tag['slug'] for tag in client.get(
+            '/api/tags/').json()], ['breakfast'])
+
+
+class IngredientSearchTest(TestCase):
+    def setUp(self):
+        self.salt, self.sugar, self.brown = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Коричневый сахар'))
+
+    def names(self, results):
+        return [ingredient.name for ingredient in results]
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_index_search(self):
+        index = IngredientIndex()
+        self.assertEqual(self.names(index.search('сах')),
+                         ['Сахар', 'Коричневый сахар'])
+        self.assertEqual(self.names(index.search('  СОЛ ')), ['Соль'])
+        self.assertEqual(index.search('перец'), [])
+        self.assertEqual(len(index.search(' ')), 3)
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_index_sees_rename_after_commit(self):
+        index = IngredientIndex()
+        self.assertEqual(index.search('перец'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.name = 'Перец'
+            self.salt.save()
+        self.assertEqual(self.names(index.search('перец')), ['Перец'])
+
+    def test_api_search(self):
+        client = APIClient()
+        for caches in (SHARED_CACHE, None):
+            with self.subTest(shared=caches is not None), override_settings(
+                    **({'CACHES': caches} if caches else {})):
+                response = client.get('/api/ingredients/', {'name': 'ах'})
+                self.assertEqual([row['name'] for row in response.json()],
+                                 ['Коричневый сахар', 'Сахар'])
+
+    def test_detail_ignores_name(self):
+        response = APIClient().get(f'/api/ingredients/{self.salt.id}/',
+                                   {'name': 'сах'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Соль')
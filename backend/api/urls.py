@@ -1,10 +1,13 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.async_views import async_urls
 from api.views import (IngredientViewSet,
+                       JobViewSet,
                        RecipeViewSet,
                        TagViewSet,
                        UsersViewSet)
+from foodgram.settings import ASYNC_VIEWS
 
 
 router_v1 = DefaultRouter()
@@ -13,8 +16,13 @@ router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register('tags', TagViewSet, basename='tags')
 router_v1.register('users', UsersViewSet, basename='users')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
+router_v1.register('jobs', JobViewSet, basename='jobs')
+
+router_urls = router_v1.urls
+if ASYNC_VIEWS:
+    router_urls = async_urls(router_urls)
 
 urlpatterns = (
-    path('', include(router_v1.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
 )
@@ -1,8 +1,42 @@
+from api.relationships import get_relationships
+from recipes.models import Recipe
 from users.models import Subscription
 
 
 def check_subscribed(request, obj):
     if request and not request.user.is_anonymous:
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_relationships(request).has(Subscription, obj.id)
     return False
+
+
+def get_recipes_limit(request):
+    limit = request.query_params.get('recipes_limit') if request else None
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
+
+def get_recipes_by_author(authors, limit=None):
+    author_ids = [author.id for author in authors]
+    recipes_by_author = {author_id: [] for author_id in author_ids}
+    if not author_ids:
+        return recipes_by_author
+    if limit is None:
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids).order_by('-pub_date', '-id')
+    else:
+        recipes = Recipe.objects.raw(
+            'SELECT id, name, image, cooking_time, author_id FROM ('
+            'SELECT id, name, image, cooking_time, author_id, pub_date, '
+            'ROW_NUMBER() OVER (PARTITION BY author_id '
+            'ORDER BY pub_date DESC, id DESC) AS row_number '
+            f'FROM {Recipe._meta.db_table} WHERE author_id IN '
+            f'({", ".join(["%s"] * len(author_ids))})'
+            ') AS ranked WHERE row_number <= %s '
+            'ORDER BY pub_date DESC, id DESC',
+            [*author_ids, limit])
+    for recipe in recipes:
+        recipes_by_author[recipe.author_id].append(recipe)
+    return recipes_by_author
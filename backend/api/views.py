@@ -1,6 +1,8 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 
@@ -13,29 +15,46 @@ from rest_framework.response import Response
 
 from recipes.models import (Favorite,
                             Ingredient,
+                            Job,
                             Recipe,
-                            RecipeIngredientAmount,
                             ShoppingCart,
+                            ShoppingCartTotal,
                             Tag)
+from recipes import cart_totals
+from recipes.jobs import enqueue
+
+from api.cache import (AnonymousResponseCacheMixin, CachedReferenceMixin,
+                       cache_is_shared)
+from api.exports import EXPORT_FORMATS, shopping_cart_response
+from api.feed import get_timeline, invalidate_timeline, publish_recipe
 from api.filters import IngredientFilter, RecipesFilter
 from api.pagination import CustomUsersPagination
-from api.serializers import (IngredientSerializer, RecipeCreateSerializer,
+from api.relationships import get_relationships
+from api.search import recipe_ingredient_index, sql_rank
+from api.serializers import (IdListSerializer,
+                             IngredientSerializer, JobSerializer,
+                             RecipeCreateSerializer,
                              RecipeSerializer, RecipeShortSerializer,
                              SubscribeSerializer,
+                             ShoppingCartTotalSerializer,
                              SubscriptionsSerializer, TagSerializer,
                              UsersSerializer)
+from api.tasks import delete_user, export_shopping_cart
+from api.utils import get_recipes_by_author, get_recipes_limit
+from foodgram.settings import RECOMMENDATIONS_TOP_K
 from users.models import Subscription, User
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
+    reference_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
+    reference_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -45,15 +64,34 @@ class UsersViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     pagination_class = CustomUsersPagination
+    cursor_ordering = ('username',)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
+    def perform_destroy(self, instance):
+        instance.is_active = False
+        instance.save(update_fields=['is_active'])
+        enqueue(delete_user, user_id=instance.id)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action == 'list' and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user,
+                                            author=OuterRef('pk'))))
+        return queryset
+
     @action(detail=False, methods=['get'],
             permission_classes=(permissions.IsAuthenticated,))
     def subscriptions(self, request):
         queryset = User.objects.filter(subscriber__user=self.request.user)
         pages = self.paginate_queryset(queryset)
-        serializer = SubscriptionsSerializer(pages, many=True,
-                                             context={'request': request})
+        recipes_by_author = get_recipes_by_author(
+            pages, get_recipes_limit(request))
+        serializer = SubscriptionsSerializer(
+            pages, many=True,
+            context={'request': request,
+                     'recipes_by_author': recipes_by_author})
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'],
@@ -69,19 +107,46 @@ class UsersViewSet(UserViewSet):
                                              context={"request": request})
             serializer.is_valid(raise_exception=True)
             Subscription.objects.create(user=request.user, author=author)
+            User.objects.filter(id=author.id).update(
+                followers_count=F('followers_count') + 1)
+            get_relationships(request).invalidate(Subscription)
+            invalidate_timeline(request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         get_object_or_404(Subscription, user=request.user,
                           author=author).delete()
+        User.objects.filter(id=author.id, followers_count__gt=0).update(
+            followers_count=F('followers_count') - 1)
+        get_relationships(request).invalidate(Subscription)
+        invalidate_timeline(request.user)
         return Response({'detail': 'Успешная отписка'},
                         status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='subscribe/batch',
+            permission_classes=(permissions.IsAuthenticated,))
+    def subscribe_batch(self, request):
+        response = self._add_or_remove_items(
+            request, model=Subscription, field='author',
+            queryset=User.objects.exclude(id=request.user.id),
+            counter=Subscription.counter_field)
+        invalidate_timeline(request.user)
+        return response
+
     @staticmethod
+    @transaction.atomic
     def _add_or_remove_item(request, model, pk, custom_serializer):
         recipe = get_object_or_404(Recipe, id=pk)
+        counter = model.counter_field
+        cart_totals.lock_users([request.user.id])
         if request.method == 'POST':
             _, created = model.objects.get_or_create(user=request.user,
                                                      recipe=recipe)
+            get_relationships(request).invalidate(model)
             if created:
+                if model is ShoppingCart:
+                    cart_totals.add_recipes(request.user, [recipe.id])
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: F(counter) + 1})
                 serializer = custom_serializer(recipe)
                 return Response(
                     {'detail': f'Рецепт добавлен в {model.__name__}!',
@@ -91,13 +156,62 @@ class UsersViewSet(UserViewSet):
                 {'message': f'Рецепт уже находится в {model.__name__}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        recipe = get_object_or_404(model, user=request.user,
-                                   recipe=recipe)
-        recipe.delete()
+        deleted, _ = model.objects.filter(user=request.user,
+                                          recipe=recipe).delete()
+        if not deleted:
+            raise Http404
+        get_relationships(request).invalidate(model)
+        if model is ShoppingCart:
+            cart_totals.remove_recipes(request.user, [recipe.id])
+        Recipe.objects.filter(id=recipe.id, **{f'{counter}__gt': 0}).update(
+            modified=timezone.now(), **{counter: F(counter) - 1})
         return Response(
             {'detail': f'Рецепт успешно удален из {model.__name__}'},
             status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    @transaction.atomic
+    def _add_or_remove_items(request, model, field, queryset, counter=None):
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        cart_totals.lock_users([request.user.id])
+        found = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+        current = set(model.objects.filter(
+            user=request.user, **{f'{field}_id__in': ids}).values_list(
+            f'{field}_id', flat=True))
+        if request.method == 'POST':
+            changed = [pk for pk in ids if pk in found and pk not in current]
+            model.objects.bulk_create(
+                [model(user=request.user, **{f'{field}_id': pk})
+                 for pk in changed],
+                ignore_conflicts=True)
+            results = {pk: 'added' if pk in changed else 'exists'
+                       if pk in current else 'not_found' for pk in ids}
+            delta, guard = 1, {}
+            if model is ShoppingCart:
+                cart_totals.add_recipes(request.user, changed)
+        else:
+            changed = [pk for pk in ids if pk in current]
+            model.objects.filter(
+                user=request.user, **{f'{field}_id__in': changed}).delete()
+            results = {pk: 'removed' if pk in current else 'not_found'
+                       for pk in ids}
+            delta, guard = -1, {f'{counter}__gt': 0}
+            if model is ShoppingCart:
+                cart_totals.remove_recipes(request.user, changed)
+        get_relationships(request).invalidate(model)
+        if counter and changed:
+            updates = {counter: F(counter) + delta}
+            if delta < 0 and queryset.model is Recipe:
+                # Удалённая строка не оставляет даты, по которой
+                # build_recommendations заметил бы изменение рецепта
+                updates['modified'] = timezone.now()
+            queryset.model.objects.filter(id__in=changed, **guard).update(
+                **updates)
+        return Response({'results': [{'id': pk, 'status': result}
+                                     for pk, result in results.items()]})
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(permissions.IsAuthenticated,))
     def favorite(self, request, pk):
@@ -115,24 +229,53 @@ class UsersViewSet(UserViewSet):
             custom_serializer=RecipeShortSerializer)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
+    response_cache_name = 'recipes'
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = CustomUsersPagination
+    cursor_ordering = ('-pub_date', '-id')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
 
+    def get_cache_tags(self, data):
+        recipes = data['results'] if 'results' in data else [data]
+        tags = set()
+        if self.action == 'list':
+            tags.add('recipes')
+            if 'search' in self.request.query_params:
+                tags.add('recipes:search')
+        for recipe in recipes:
+            tags.add(f'recipe:{recipe["id"]}')
+            tags.add(f'user:{recipe["author"]["id"]}')
+            tags.update(f'tag:{tag["id"]}' for tag in recipe['tags'])
+            tags.update(f'ingredient:{ingredient["id"]}'
+                        for ingredient in recipe['ingredients'])
+        return tags
+
+    def get_queryset(self):
+        user = self.request.user
+        return Recipe.objects.with_related(user).with_user_flags(user)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeCreateSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        transaction.on_commit(lambda: publish_recipe(recipe))
 
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        User.objects.filter(id=instance.author_id, recipes_count__gt=0).update(
+            recipes_count=F('recipes_count') - 1)
+        cart_totals.remove_recipe_everywhere(instance.id)
+        instance.delete()
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(permissions.IsAuthenticated,), )
     def favorite(self, request, pk):
@@ -151,18 +294,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk=pk,
             custom_serializer=RecipeShortSerializer)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=(permissions.IsAuthenticated,))
+    def feed(self, request):
+        page = self.paginate_queryset(get_timeline(request.user))
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in page
+             if recipe_id in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/batch',
+            permission_classes=(permissions.IsAuthenticated,))
+    def favorite_batch(self, request):
+        return UsersViewSet._add_or_remove_items(
+            request=request, model=Favorite, field='recipe',
+            queryset=Recipe.objects.all(), counter=Favorite.counter_field)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/batch',
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return UsersViewSet._add_or_remove_items(
+            request=request, model=ShoppingCart, field='recipe',
+            queryset=Recipe.objects.all(),
+            counter=ShoppingCart.counter_field)
+
+    @action(detail=False, methods=['get'], url_path='shopping_cart/totals',
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_totals(self, request):
+        totals = ShoppingCartTotal.objects.filter(
+            user=request.user).select_related('ingredient').order_by(
+            'ingredient__name')
+        return Response(
+            ShoppingCartTotalSerializer(totals, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk):
+        recipes = self.get_queryset().filter(
+            neighbour_of__recipe_id=pk).order_by('-neighbour_of__score')
+        serializer = self.get_serializer(
+            recipes[:RECOMMENDATIONS_TOP_K], many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
+    def discover(self, request):
+        values = [value for param in request.query_params.getlist(
+            'ingredients') for value in param.split(',') if value]
+        if not values or not all(value.isdigit() for value in values):
+            return Response(
+                {'detail': 'Укажите id ингредиентов в параметре ingredients'},
+                status=status.HTTP_400_BAD_REQUEST)
+        ids = [int(value) for value in values]
+        ranked = (recipe_ingredient_index.rank(ids) if cache_is_shared()
+                  else sql_rank(ids))
+        page = self.paginate_queryset(ranked)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _ in page
+             if recipe_id in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get', 'post'],
+            permission_classes=(permissions.IsAuthenticated,))
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredientAmount.objects.filter(
-            recipe__shoppingcarts__user=request.user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(
-            total_amount=Sum('amount'))
-        data = ingredients.values_list('ingredient__name',
-                                       'ingredient__measurement_unit',
-                                       'total_amount')
-        shopping_cart = 'Список покупок:\n'
-        for name, measure, amount in data:
-            shopping_cart += f'- {name} в количестве: {amount} {measure},\n'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f'Неизвестный формат файла: {file_format}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'POST':
+            job = enqueue(export_shopping_cart, user=request.user,
+                          file_format=file_format)
+            return Response(JobSerializer(job).data,
+                            status=status.HTTP_202_ACCEPTED)
+        return shopping_cart_response(request, file_format)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    pagination_class = CustomUsersPagination
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).defer('output')
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk):
+        job = get_object_or_404(Job, id=pk, user=request.user)
+        if job.status != Job.DONE or job.output is None:
+            return Response({'detail': 'Файл ещё не готов'},
+                            status=status.HTTP_404_NOT_FOUND)
+        _, content_type = EXPORT_FORMATS[job.result['file_format']]
+        response = HttpResponse(bytes(job.output), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.'
+            f'{job.result["file_format"]}"')
         return response
@@ -0,0 +1,118 @@
+import threading
+from collections import Counter, deque
+from time import monotonic, perf_counter
+
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from foodgram.settings import DB_HEALTH_CHECK_INTERVAL
+
+stats = Counter()
+pools = {}
+pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.stats = Counter()
+
+    def acquire(self, connect, is_usable):
+        started = perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.stats['timeouts'] += 1
+            raise PoolTimeout(
+                f'Нет свободных соединений за {self.timeout} с')
+        with self.lock:
+            self.stats['wait_seconds'] += perf_counter() - started
+            self.stats['acquired'] += 1
+            self.stats['in_use'] += 1
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, released_at = self.idle.pop()
+                if (monotonic() - released_at < DB_HEALTH_CHECK_INTERVAL
+                        or is_usable(connection)):
+                    return connection
+                self.discard(connection)
+            with self.lock:
+                self.stats['created'] += 1
+            return connect()
+        except BaseException:
+            self.release(None)
+            raise
+
+    def release(self, connection):
+        with self.lock:
+            self.stats['in_use'] -= 1
+            if connection is not None:
+                self.idle.append((connection, monotonic()))
+        self.slots.release()
+
+    def discard(self, connection):
+        with self.lock:
+            self.stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(alias, size, timeout):
+    if alias not in pools:
+        with pools_lock:
+            pools.setdefault(alias, ConnectionPool(size, timeout))
+    return pools[alias]
+
+
+def connection_stats():
+    rows = [(f'db_{name}', {'alias': alias}, value)
+            for (name, alias), value in sorted(stats.items())]
+    for alias, pool in sorted(pools.items()):
+        with pool.lock:
+            values = dict(pool.stats, size=pool.size, idle=len(pool.idle))
+        rows.extend((f'db_pool_{name}', {'alias': alias}, value)
+                    for name, value in sorted(values.items()))
+    return rows
+
+
+@receiver(connection_created)
+def count_connection(connection, **kwargs):
+    connection.last_used_at = monotonic()
+    stats['connections_opened', connection.alias] += 1
+
+
+@receiver(request_finished)
+def mark_connections_used(**kwargs):
+    now = monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used_at = now
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    # Проверяется только соединение, простоявшее без запросов дольше
+    # DB_HEALTH_CHECK_INTERVAL: его мог закрыть сервер или балансировщик
+    now = monotonic()
+    for connection in connections.all():
+        if (connection.connection is None
+                or now - connection.last_used_at < DB_HEALTH_CHECK_INTERVAL):
+            continue
+        connection.last_used_at = now
+        if not connection.is_usable():
+            stats['health_check_failures', connection.alias] += 1
+            connection.close()
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from foodgram.db import connection_stats
+from foodgram.settings import (INTERNAL_IPS, METRICS_BUCKETS,
+                               METRICS_DUPLICATE_THRESHOLD, METRICS_ENABLED)
+
+logger = logging.getLogger('foodgram.metrics')
+
+
+class Registry:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.seconds = Counter()
+        self.queries = Counter()
+        self.sql_seconds = Counter()
+        self.histogram = defaultdict(lambda: [0] * (len(buckets) + 1))
+
+    def observe(self, view, status, duration, queries, sql_duration):
+        with self.lock:
+            self.requests[view, status] += 1
+            self.seconds[view] += duration
+            self.queries[view] += queries
+            self.sql_seconds[view] += sql_duration
+            self.histogram[view][bisect_left(self.buckets, duration)] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# TYPE foodgram_requests_total counter')
+            for (view, status), value in sorted(self.requests.items()):
+                lines.append(f'foodgram_requests_total{{view="{view}",'
+                             f'status="{status}"}} {value}')
+            lines.append('# TYPE foodgram_request_duration_seconds histogram')
+            for view, counts in sorted(self.histogram.items()):
+                total = 0
+                for bound, count in zip(self.buckets + (float('inf'),),
+                                        counts):
+                    total += count
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append('foodgram_request_duration_seconds_bucket'
+                                 f'{{view="{view}",le="{le}"}} {total}')
+                lines.append('foodgram_request_duration_seconds_sum'
+                             f'{{view="{view}"}} {self.seconds[view]:.6f}')
+                lines.append('foodgram_request_duration_seconds_count'
+                             f'{{view="{view}"}} {total}')
+            for name, values in (('db_queries_total', self.queries),
+                                 ('db_seconds_total', self.sql_seconds)):
+                lines.append(f'# TYPE foodgram_{name} counter')
+                for view, value in sorted(values.items()):
+                    lines.append(f'foodgram_{name}{{view="{view}"}} {value}')
+        rows = [row for collector in collectors for row in collector()]
+        for name, labels, value in rows:
+            labels = ','.join(f'{key}="{label}"'
+                              for key, label in labels.items())
+            lines.append(f'foodgram_{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(METRICS_BUCKETS)
+collectors = [connection_stats]
+
+
+def register_collector(collector):
+    if collector not in collectors:
+        collectors.append(collector)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+query_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_queries():
+    # execute_wrapper ставится на соединение потока, а асинхронные
+    # представления выполняются в других потоках; счётчик текущего запроса
+    # передаётся в них через контекст
+    recorder = query_recorder.get()
+    if recorder is None:
+        return nullcontext()
+    return connections['default'].execute_wrapper(recorder)
+
+
+def view_label(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        token = query_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            with record_queries():
+                response = self.get_response(request)
+        finally:
+            query_recorder.reset(token)
+        duration = time.perf_counter() - start
+        view = view_label(request)
+        registry.observe(view, response.status_code, duration,
+                         recorder.count, recorder.duration)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"')
+        duplicates = [(sql, count)
+                      for sql, count in recorder.statements.most_common(3)
+                      if count >= METRICS_DUPLICATE_THRESHOLD]
+        if duplicates:
+            logger.warning(
+                'Повторяющиеся запросы в %s %s (%s): %s',
+                request.method, request.path, view,
+                '; '.join(f'{count}x {sql}' for sql, count in duplicates))
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in INTERNAL_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,47 @@
+from django.db.backends.postgresql.base import \
+    DatabaseWrapper as PostgresDatabaseWrapper
+from django.db.backends.postgresql.base import Database
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from foodgram.db import PoolTimeout, get_pool
+from foodgram.settings import DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    @property
+    def pool(self):
+        return get_pool(self.alias, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params),
+                self.is_connection_usable)
+        except PoolTimeout as error:
+            raise Database.OperationalError(str(error))
+
+    @staticmethod
+    def is_connection_usable(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection, pool = self.connection, self.pool
+        try:
+            if (not connection.closed and connection.get_transaction_status()
+                    != TRANSACTION_STATUS_IDLE):
+                connection.rollback()
+        except Database.Error:
+            pass
+        if connection.closed:
+            pool.discard(connection)
+            pool.release(None)
+        else:
+            pool.release(connection)
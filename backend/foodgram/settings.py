@@ -38,6 +38,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'foodgram.metrics.MetricsMiddleware')
+
+INTERNAL_IPS = os.getenv('INTERNAL_IPS', '127.0.0.1').split(',')
+
 ROOT_URLCONF = 'foodgram.urls'
 TEMPLATES_DIR = BASE_DIR / 'templates'
 
@@ -65,21 +71,40 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+DB_POOL = os.getenv('DB_POOL', 'false').lower() == 'true'
+
 DATABASES = {
     'default': {
         # Меняем настройку Django: теперь для работы будет использоваться
         # бэкенд postgresql
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': ('foodgram.postgresql_pool' if DB_POOL
+                   else 'django.db.backends.postgresql'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # С пулом соединение возвращается в пул в конце каждого запроса
+        'CONN_MAX_AGE': (0 if DB_POOL
+                         else int(os.getenv('DB_CONN_MAX_AGE', 60))),
+        # PgBouncer в режиме transaction не сохраняет курсоры между
+        # транзакциями, поэтому .iterator() работает на клиенте
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', 'false').lower() == 'true',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -135,7 +160,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -161,3 +186,43 @@ CORS_ORIGIN_WHITELIST = [
 
 MAX_LENGTH = 200
 PAGE_SIZE = 6
+REFERENCE_CACHE_ALIAS = 'default'
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+REFERENCE_CACHE_MAX_AGE = 60
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_MAX_PIXELS = 4096 * 4096
+IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_WORKERS = 2
+CURSOR_COUNT_CACHE_TIMEOUT = 60
+SEARCH_CONFIG = 'russian'
+FEED_STORE = os.getenv('FEED_STORE', 'api.feed.CacheTimelineStore')
+FEED_LENGTH = 500
+FEED_TIMEOUT = 60 * 60
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+RECOMMENDATIONS_TOP_K = 10
+BATCH_MAX_SIZE = 100
+METRICS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+METRICS_DUPLICATE_THRESHOLD = 5
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+ASYNC_THREADS = int(os.getenv('ASYNC_THREADS', 8))
+ASYNC_ROUTES = ('recipes-list', 'recipes-detail', 'ingredients-list',
+                'ingredients-detail', 'tags-list', 'tags-detail')
+DB_HEALTH_CHECK_INTERVAL = 30
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = 5
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TIMEOUT = 5 * 60
+AUTH_CACHE_SHARED = os.getenv('AUTH_CACHE_SHARED', 'false').lower() == 'true'
+RESPONSE_CACHE_TIMEOUT = 10 * 60
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RESPONSE_CACHE_WAIT = 2
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_BATCH_SIZE = 1000
+JOB_RETRY_DELAY = 10
+JOB_TIMEOUT = 15 * 60
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_POLL_INTERVAL = 1
@@ -0,0 +1,127 @@
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.db.backends.postgresql.base import Database
+from django.test import SimpleTestCase, TransactionTestCase
+
+from foodgram.db import (ConnectionPool, PoolTimeout, check_connections,
+                         mark_connections_used)
+from foodgram.settings import DB_HEALTH_CHECK_INTERVAL
+from users.models import User
+
+POOLED = connection.settings_dict['ENGINE'] == 'foodgram.postgresql_pool'
+
+
+class FakeConnection:
+    def __init__(self, usable=True):
+        self.usable = usable
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def test_checkout_and_return(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        first = pool.acquire(FakeConnection, lambda conn: conn.usable)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection, lambda conn: conn.usable)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection, lambda conn: True), first)
+        self.assertEqual((pool.stats['created'], pool.stats['timeouts'],
+                          pool.stats['in_use']), (1, 1, 1))
+
+    def test_broken_idle_connection_is_replaced(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        broken = FakeConnection(usable=False)
+        pool.release(pool.acquire(lambda: broken, lambda conn: True))
+        pool.idle[0] = (broken, 0)
+        fresh = pool.acquire(FakeConnection, lambda conn: conn.usable)
+        self.assertIsNot(fresh, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats['discarded'], 1)
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+
+        def connect():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            pool.acquire(connect, lambda conn: True)
+        self.assertIsNotNone(pool.acquire(FakeConnection, lambda conn: True))
+
+
+class HealthCheckTest(SimpleTestCase):
+    databases = {'default'}
+
+    def test_only_idle_connections_are_checked(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=False) as is_usable, \
+                mock.patch.object(connection, 'close') as close:
+            connection.last_used_at = 0
+            mark_connections_used()
+            check_connections()
+            is_usable.assert_not_called()
+            connection.last_used_at -= DB_HEALTH_CHECK_INTERVAL + 1
+            check_connections()
+            is_usable.assert_called_once()
+            close.assert_called_once()
+
+
+@skipUnless(POOLED, 'Нужен PostgreSQL и DB_POOL=true')
+class PooledBackendTest(TransactionTestCase):
+    def raw_connection(self):
+        connection.ensure_connection()
+        return connection.connection
+
+    def test_connection_returns_to_pool(self):
+        raw = self.raw_connection()
+        connection.close()
+        self.assertIn(raw, [conn for conn, _ in connection.pool.idle])
+        self.assertIs(self.raw_connection(), raw)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        raw = self.raw_connection()
+        connection.set_autocommit(False)
+        User.objects.create(username='pooled', email='pooled@example.com')
+        connection.close()
+        self.assertIs(self.raw_connection(), raw)
+        self.assertFalse(User.objects.filter(username='pooled').exists())
+
+    def test_terminated_connection_is_replaced(self):
+        raw = self.raw_connection()
+        pid = raw.get_backend_pid()
+        connection.close()
+        connection.pool.idle[-1] = (raw, 0)
+        with connection.pool.lock:
+            discarded = connection.pool.stats['discarded']
+        killer = Database.connect(**connection.get_connection_params())
+        try:
+            with killer.cursor() as cursor:
+                cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        finally:
+            killer.close()
+        self.assertIsNot(self.raw_connection(), raw)
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(connection.pool.stats['discarded'], discarded + 1)
+
+    def test_disable_server_side_cursors(self):
+        settings = connection.settings_dict
+        original = settings['DISABLE_SERVER_SIDE_CURSORS']
+        User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(3))
+        try:
+            for disabled in (False, True):
+                settings['DISABLE_SERVER_SIDE_CURSORS'] = disabled
+                with self.subTest(disabled=disabled):
+                    cursor = connection.chunked_cursor()
+                    self.assertEqual(cursor.cursor.name is None, disabled)
+                    cursor.close()
+                    self.assertEqual(len(list(
+                        User.objects.iterator(chunk_size=1))), 3)
+        finally:
+            settings['DISABLE_SERVER_SIDE_CURSORS'] = original
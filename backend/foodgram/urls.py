@@ -16,7 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from foodgram.metrics import metrics_view
+from foodgram.settings import METRICS_ENABLED
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
+
+if METRICS_ENABLED:
+    urlpatterns.append(path('metrics/', metrics_view))
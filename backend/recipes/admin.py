@@ -1,15 +1,54 @@
 from django.contrib import admin
+from django.db import transaction
 
 
+from api.search import recipe_ingredient_index
+from recipes import cart_totals
 from recipes.models import (Favorite,
                             Ingredient,
+                            Job,
                             Recipe,
                             RecipeIngredientAmount,
                             ShoppingCart,
                             Tag)
+from recipes.search import update_search_vector
 from recipes.validate_delete import ValidateDeliteForm
 
 
+class CartTotalsAdminMixin:
+    # Админка меняет рецепты и списки покупок в обход API, поэтому итоги
+    # затронутых пользователей пересчитываются целиком
+    cart_user_lookup = None
+
+    def cart_users(self, queryset):
+        lookup = self.cart_user_lookup
+        return set(queryset.filter(**{f'{lookup}__isnull': False}).values_list(
+            lookup, flat=True))
+
+    def object_cart_users(self, obj):
+        return self.cart_users(type(obj).objects.filter(pk=obj.pk))
+
+    def save_model(self, request, obj, form, change):
+        request.cart_users = self.object_cart_users(obj) if change else set()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        cart_totals.rebuild_users(
+            getattr(request, 'cart_users', set())
+            | self.object_cart_users(form.instance))
+
+    def delete_model(self, request, obj):
+        users = self.object_cart_users(obj)
+        super().delete_model(request, obj)
+        cart_totals.rebuild_users(users)
+
+    def delete_queryset(self, request, queryset):
+        users = self.cart_users(queryset)
+        super().delete_queryset(request, queryset)
+        cart_totals.rebuild_users(users)
+
+
 class TagStackedInline(admin.TabularInline):
     model = Recipe.tags.through
     extra = 0
@@ -25,14 +64,24 @@ class RecipeIngredientAmountInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author',)
+class RecipeAdmin(CartTotalsAdminMixin, admin.ModelAdmin):
+    cart_user_lookup = 'shoppingcarts__user'
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     empty_value_display = '-пусто-'
     inlines = [TagStackedInline, RecipeIngredientAmountInline]
     exclude = ('tags',)
     formset = ValidateDeliteForm
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vector(Recipe.objects.filter(id=form.instance.id))
+        ingredient_ids = list(form.instance.recipes.values_list(
+            'ingredient_id', flat=True))
+        transaction.on_commit(lambda: recipe_ingredient_index.update_recipe(
+            form.instance.id, ingredient_ids))
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -42,7 +91,7 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit',)
+    list_display = ('name', 'measurement_unit', 'density')
     list_filter = ('name',)
     empty_value_display = '-пусто-'
 
@@ -54,10 +103,23 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(CartTotalsAdminMixin, admin.ModelAdmin):
     model = ShoppingCart
+    cart_user_lookup = 'user'
     list_display = ('user', 'recipe', )
 
 
+@admin.register(RecipeIngredientAmount)
+class RecipeIngredientAmountAdmin(CartTotalsAdminMixin, admin.ModelAdmin):
+    cart_user_lookup = 'recipe__shoppingcarts__user'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'user', 'status', 'attempts', 'created',
+                    'duration')
+    list_filter = ('status', 'name')
+    readonly_fields = ('started_at', 'finished_at', 'duration')
+
+
 admin.site.site_header = 'Административная страница проекта Foodgram'
-admin.site.register(RecipeIngredientAmount)
@@ -0,0 +1,117 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from recipes.models import (RecipeIngredientAmount, ShoppingCart,
+                            ShoppingCartTotal)
+from users.models import User
+
+
+def recipe_amounts(recipe_ids):
+    return RecipeIngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids, amount__isnull=False).values(
+        'ingredient_id').annotate(total=Sum('amount')).values_list(
+        'ingredient_id', 'total')
+
+
+def lock_users(user_ids):
+    # Строка пользователя служит замком для его избранного, списка покупок,
+    # подписок и итогов: параллельные запросы одного пользователя
+    # выполняются по очереди
+    list(User.objects.select_for_update().filter(
+        id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+
+@transaction.atomic
+def apply_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Без замка два запроса, добавляющие новую пару (пользователь,
+    # ингредиент), оба вставили бы строку и один упал бы на уникальности
+    lock_users({user_id for user_id, _ in deltas})
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingCartTotal.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas})}
+    changed, created, removed = [], [], []
+    for (user_id, ingredient_id), delta in deltas.items():
+        row = existing.get((user_id, ingredient_id))
+        if row is None:
+            if delta > 0:
+                created.append(ShoppingCartTotal(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=delta))
+        elif row.amount + delta > 0:
+            row.amount += delta
+            changed.append(row)
+        else:
+            removed.append(row.id)
+    if removed:
+        ShoppingCartTotal.objects.filter(id__in=removed).delete()
+    if changed:
+        ShoppingCartTotal.objects.bulk_update(changed, ['amount'])
+    ShoppingCartTotal.objects.bulk_create(created)
+    User.objects.filter(
+        id__in={user_id for user_id, _ in deltas}).update(
+        cart_modified=timezone.now())
+
+
+def add_recipes(user, recipe_ids, sign=1):
+    if recipe_ids:
+        apply_deltas({(user.id, ingredient_id): sign * total
+                      for ingredient_id, total in recipe_amounts(recipe_ids)})
+
+
+def remove_recipes(user, recipe_ids):
+    add_recipes(user, recipe_ids, sign=-1)
+
+
+def change_recipe(recipe_id, ingredient_deltas):
+    ingredient_deltas = {ingredient_id: delta for ingredient_id, delta
+                         in ingredient_deltas.items() if delta}
+    if not ingredient_deltas:
+        return
+    apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in ShoppingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True)
+        for ingredient_id, delta in ingredient_deltas.items()})
+
+
+def remove_recipe_everywhere(recipe_id):
+    amounts = dict(recipe_amounts([recipe_id]))
+    change_recipe(recipe_id, {ingredient_id: -total
+                              for ingredient_id, total in amounts.items()})
+
+
+def fresh_totals(user_ids=None):
+    # Условия на пользователя в одном filter(), иначе Django добавит второе
+    # соединение со списками покупок и суммы умножатся
+    users = ({'recipe__shoppingcarts__user__isnull': False} if user_ids is None
+             else {'recipe__shoppingcarts__user__in': user_ids})
+    amounts = RecipeIngredientAmount.objects.filter(amount__isnull=False,
+                                                    **users)
+    return Counter({
+        (row['recipe__shoppingcarts__user'], row['ingredient']): row['total']
+        for row in amounts.values(
+            'recipe__shoppingcarts__user', 'ingredient').annotate(
+            total=Sum('amount')).filter(total__gt=0).iterator()})
+
+
+@transaction.atomic
+def rebuild_users(user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    lock_users(user_ids)
+    ShoppingCartTotal.objects.filter(user_id__in=user_ids).delete()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=amount)
+        for (user_id, ingredient_id), amount
+        in fresh_totals(user_ids).items())
+    User.objects.filter(id__in=user_ids).update(cart_modified=timezone.now())
@@ -0,0 +1,77 @@
+import traceback
+from datetime import timedelta
+from time import perf_counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from foodgram.settings import JOB_RETRY_DELAY, JOB_TIMEOUT
+from recipes.models import Job
+
+
+def enqueue(func, user=None, **payload):
+    return Job.objects.create(name=f'{func.__module__}.{func.__name__}',
+                              user=user, payload=payload)
+
+
+@transaction.atomic
+def claim_jobs(limit):
+    now = timezone.now()
+    # Воркер раз в JOB_HEARTBEAT_INTERVAL отмечает свои задачи, поэтому
+    # без сигнала дольше JOB_TIMEOUT остаются только задачи упавших воркеров
+    stale = Job.objects.filter(
+        Q(heartbeat_at__lt=now - timedelta(seconds=JOB_TIMEOUT))
+        | Q(heartbeat_at__isnull=True,
+            started_at__lt=now - timedelta(seconds=JOB_TIMEOUT)),
+        status=Job.RUNNING)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now,
+        error='Воркер не завершил задачу за отведённое время')
+    stale.update(status=Job.PENDING, run_after=now)
+    ids = list(Job.objects.select_for_update(skip_locked=True).filter(
+        status=Job.PENDING, run_after__lte=now).order_by(
+        'run_after', 'id').values_list('id', flat=True)[:limit])
+    Job.objects.filter(id__in=ids).update(
+        status=Job.RUNNING, started_at=now, heartbeat_at=now,
+        attempts=F('attempts') + 1)
+    return ids
+
+
+def heartbeat(job_ids):
+    Job.objects.filter(id__in=job_ids, status=Job.RUNNING).update(
+        heartbeat_at=timezone.now())
+
+
+def run_job(job_id):
+    job = Job.objects.get(id=job_id)
+    started = perf_counter()
+    try:
+        job.result = import_string(job.name)(job, **job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.error = ''
+    job.duration = perf_counter() - started
+    job.finished_at = timezone.now()
+    job.save(update_fields=('result', 'error', 'status', 'run_after',
+                            'duration', 'finished_at'))
+    return job.name, job.status, job.duration
+
+
+def job_stats():
+    rows = []
+    for row in Job.objects.order_by().values('name', 'status').annotate(
+            total=Count('id'), seconds=Sum('duration')):
+        labels = {'name': row['name'], 'status': row['status']}
+        rows.append(('jobs_total', labels, row['total']))
+        rows.append(('jobs_seconds_total', labels, row['seconds'] or 0))
+    return rows
@@ -0,0 +1,286 @@
+import csv
+import json
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from foodgram.settings import ALLOWED_HOSTS, BASE_DIR
+from recipes.cart_totals import fresh_totals
+from recipes.management.commands.recount import count_related
+from recipes.models import (Favorite, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCart,
+                            ShoppingCartTotal, Tag)
+from recipes.search import update_search_vector
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+INGREDIENTS_FILE = BASE_DIR / 'data' / 'ingredients.csv'
+SERVER_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def summarize(timings, queries, elapsed):
+    timings = sorted(timings)
+    return {
+        'p50': round(percentile(timings, 0.5), 2),
+        'p95': round(percentile(timings, 0.95), 2),
+        'p99': round(percentile(timings, 0.99), 2),
+        'queries': max(queries) if queries else None,
+        'rps': round(len(timings) / elapsed, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон основных эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--subscriptions', type=int, default=10)
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default='bench_baseline.json')
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимый рост p95 относительно базы')
+        parser.add_argument('--keep', action='store_true',
+                            help='Сохранить сгенерированные данные')
+        parser.add_argument('--http',
+                            help='Адрес запущенного сервера для прогона '
+                                 'по HTTP, например http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def load_ingredients(self):
+        if not Ingredient.objects.exists():
+            with open(INGREDIENTS_FILE, encoding='utf-8') as file:
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in csv.reader(file)),
+                    batch_size=BATCH_SIZE, ignore_conflicts=True)
+        return list(Ingredient.objects.values_list('id', 'name'))
+
+    def seed(self, options):
+        if User.objects.filter(username__startswith='bench_').exists():
+            raise CommandError('Тестовые пользователи bench_* уже есть в '
+                               'базе, удалите их перед запуском')
+        rng = random.Random(options['seed'])
+        ingredients = self.load_ingredients()
+        tags = [Tag.objects.get_or_create(
+            slug=f'bench-{i}',
+            defaults={'name': f'bench-{i}', 'color': f'#be{i:04x}'})[0]
+            for i in range(options['tags'])]
+        User.objects.bulk_create(
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com',
+                 first_name='Bench', last_name=str(i))
+            for i in range(options['users']))
+        users = list(User.objects.filter(
+            username__startswith='bench_').values_list('id', flat=True))
+        bench_users = set(users)
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=rng.choice(users),
+                    name=' '.join(name for _, name
+                                  in rng.sample(ingredients, 2)),
+                    text=' '.join(name for _, name
+                                  in rng.sample(ingredients, 8)),
+                    cooking_time=rng.randint(1, 180))
+             for _ in range(options['recipes'])),
+            batch_size=BATCH_SIZE)
+        recipes = list(Recipe.objects.filter(
+            author_id__in=users).values_list('id', flat=True))
+        RecipeIngredientAmount.objects.bulk_create(
+            (RecipeIngredientAmount(recipe_id=recipe_id, ingredient_id=pk,
+                                    amount=rng.randint(1, 500))
+             for recipe_id in recipes
+             for pk, _ in rng.sample(ingredients,
+                                     options['ingredients_per_recipe'])),
+            batch_size=BATCH_SIZE)
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            (through(recipe_id=recipe_id, tag_id=tag.id)
+             for recipe_id in recipes
+             for tag in rng.sample(tags, rng.randint(1, len(tags)))),
+            batch_size=BATCH_SIZE)
+        for model, size in ((Favorite, options['favorites']),
+                            (ShoppingCart, options['carts'])):
+            model.objects.bulk_create(
+                (model(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in users
+                 for recipe_id in rng.sample(recipes,
+                                             min(size, len(recipes)))),
+                batch_size=BATCH_SIZE)
+        Subscription.objects.bulk_create(
+            (Subscription(user_id=user_id, author_id=author_id)
+             for user_id in users
+             for author_id in rng.sample(users, min(options['subscriptions'],
+                                                    len(users)))
+             if author_id != user_id),
+            batch_size=BATCH_SIZE)
+        ShoppingCartTotal.objects.bulk_create(
+            (ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                               amount=amount)
+             for (user_id, ingredient_id), amount in fresh_totals().items()
+             if user_id in bench_users),
+            batch_size=BATCH_SIZE)
+        Recipe.objects.filter(pk__in=recipes).update(
+            favorites_count=count_related(Favorite, 'recipe'),
+            in_carts_count=count_related(ShoppingCart, 'recipe'))
+        User.objects.filter(pk__in=users).update(
+            recipes_count=count_related(Recipe, 'author'),
+            followers_count=count_related(Subscription, 'author'))
+        update_search_vector(Recipe.objects.filter(pk__in=recipes))
+        user = User.objects.get(pk=users[0])
+        return {
+            'token': Token.objects.get_or_create(user=user)[0].key,
+            'author': rng.choice(users),
+            'recipe': rng.choice(recipes),
+            'tags': [tag.slug for tag in tags[:2]],
+            'search': rng.choice(ingredients)[1].split()[0],
+            'ingredient': rng.choice(ingredients)[1][:3],
+        }
+
+    def endpoints(self, data):
+        filters = {
+            'tags': '&'.join(f'tags={slug}' for slug in data['tags']),
+            'author': f'author={data["author"]}',
+            'is_favorited': 'is_favorited=1',
+            'is_in_shopping_cart': 'is_in_shopping_cart=1',
+            'search': f'search={quote(data["search"])}',
+        }
+        for size in range(len(filters) + 1):
+            for names in combinations(filters, size):
+                yield (f'recipes-list[{"+".join(names)}]',
+                       '/api/recipes/?' + '&'.join(
+                           filters[name] for name in names))
+        yield 'recipes-detail', f'/api/recipes/{data["recipe"]}/'
+        yield 'users-subscriptions', '/api/users/subscriptions/'
+        yield 'ingredients-search', (
+            f'/api/ingredients/?name={quote(data["ingredient"])}')
+        yield 'download-shopping-cart', (
+            '/api/recipes/download_shopping_cart/')
+
+    # Client отправляет Host: testserver, которого нет в ALLOWED_HOSTS
+    @override_settings(ALLOWED_HOSTS=[*ALLOWED_HOSTS, 'testserver'])
+    def run_client(self, data, repeat):
+        client = Client(HTTP_AUTHORIZATION=f'Token {data["token"]}')
+        results = {}
+        for name, url in self.endpoints(data):
+            timings, queries = [], []
+            started = perf_counter()
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as context:
+                    request_started = perf_counter()
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    timings.append((perf_counter() - request_started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{url}: статус {response.status_code}')
+                queries.append(len(context.captured_queries))
+            results[name] = summarize(timings, queries,
+                                      perf_counter() - started)
+        return results
+
+    def fetch(self, url, token):
+        request = Request(url, headers={'Authorization': f'Token {token}'})
+        started = perf_counter()
+        with urlopen(request) as response:
+            response.read()
+            timing = response.headers.get('Server-Timing', '')
+        found = SERVER_QUERIES.search(timing)
+        return ((perf_counter() - started) * 1000,
+                int(found.group(1)) if found else None)
+
+    def run_http(self, data, repeat, base_url, concurrency):
+        results = {}
+        with ThreadPoolExecutor(concurrency) as executor:
+            for name, url in self.endpoints(data):
+                started = perf_counter()
+                responses = list(executor.map(
+                    lambda url: self.fetch(url, data['token']),
+                    [base_url.rstrip('/') + url] * repeat))
+                results[name] = summarize(
+                    [timing for timing, _ in responses],
+                    [count for _, count in responses if count is not None],
+                    perf_counter() - started)
+        return results
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if (result['queries'] is not None
+                    and expected['queries'] is not None
+                    and result['queries'] > expected['queries']):
+                regressions.append(
+                    f'{name}: запросов {result["queries"]} '
+                    f'вместо {expected["queries"]}')
+            if result['p95'] > expected['p95'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {result["p95"]} мс '
+                    f'вместо {expected["p95"]} мс')
+        return regressions
+
+    def report(self, results):
+        width = max(map(len, results))
+        self.stdout.write(f'{"endpoint":<{width}}  {"p50":>8} {"p95":>8} '
+                          f'{"p99":>8} {"queries":>7} {"rps":>8}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<{width}}  {result["p50"]:>8} {result["p95"]:>8} '
+                f'{result["p99"]:>8} {str(result["queries"]):>7} '
+                f'{result["rps"]:>8}')
+
+    def handle(self, *args, **options):
+        if options['http'] and not options['keep']:
+            raise CommandError('Для прогона по HTTP нужен флаг --keep: '
+                               'сервер не видит незафиксированных данных')
+        with transaction.atomic():
+            started = perf_counter()
+            data = self.seed(options)
+            self.stdout.write(f'Данные созданы за '
+                              f'{perf_counter() - started:.1f} с')
+            if not options['http']:
+                results = self.run_client(data, options['repeat'])
+            transaction.set_rollback(not options['keep'])
+        if options['http']:
+            results = self.run_http(data, options['repeat'], options['http'],
+                                    options['concurrency'])
+        self.report(results)
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2,
+                                                ensure_ascii=False))
+            self.stdout.write(f'База сохранена в {baseline_path}')
+            return
+        if not baseline_path.exists():
+            self.stdout.write('Базовые результаты не найдены, '
+                              'сохраните их флагом --save-baseline')
+            return
+        regressions = self.compare(
+            results, json.loads(baseline_path.read_text()),
+            options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессия производительности:\n'
+                               + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено'))
@@ -0,0 +1,44 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.search import RecipeIngredientIndex, sql_rank
+from recipes.models import RecipeIngredientAmount
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает подбор рецептов по индексу и SQL-запросом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, rank, queries):
+        timings = []
+        for ingredient_ids in queries:
+            started = perf_counter()
+            rank(ingredient_ids)
+            timings.append((perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], timings[-1]
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        used = list(RecipeIngredientAmount.objects.values_list(
+            'ingredient_id', flat=True).distinct())
+        if not used:
+            self.stdout.write('Нет рецептов с ингредиентами')
+            return
+        queries = [rng.sample(used, min(options['size'], len(used)))
+                   for _ in range(options['repeat'])]
+        index = RecipeIngredientIndex()
+        started = perf_counter()
+        index.rank([])
+        self.stdout.write(
+            f'Индекс построен за {(perf_counter() - started) * 1000:.1f} мс')
+        for title, rank in (('sql', sql_rank), ('index', index.rank)):
+            median, worst = self.measure(rank, queries)
+            self.stdout.write(
+                f'{title}: p50 {median:.2f} мс, max {worst:.2f} мс')
@@ -0,0 +1,35 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов по индексу и через БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('queries', nargs='*',
+                            default=['а', 'мо', 'сах', 'карто', 'соль'])
+
+    def measure(self, search, queries, repeat):
+        started = perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                search(query)
+        return (perf_counter() - started) / (repeat * len(queries)) * 1000
+
+    def handle(self, *args, **options):
+        queries, repeat = options['queries'], options['repeat']
+        index = IngredientIndex()
+        index.search('')
+        results = (
+            ('db ^name', lambda query: list(
+                Ingredient.objects.filter(name__istartswith=query))),
+            ('index', index.search),
+        )
+        for title, search in results:
+            self.stdout.write(
+                f'{title}: {self.measure(search, queries, repeat):.3f} мс')
@@ -0,0 +1,74 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Ingredient, Recipe, RecipeIngredientAmount
+from recipes.search import (fallback_search, search_recipes,
+                            update_search_vector, uses_postgres)
+from users.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Замеряет полнотекстовый поиск рецептов на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        author = User.objects.create(username='bench_search',
+                                     email='bench_search@example.com')
+        Recipe.objects.bulk_create(
+            (Recipe(author=author,
+                    name=' '.join(name for _, name
+                                  in rng.sample(ingredients, 2)),
+                    text=' '.join(name for _, name
+                                  in rng.sample(ingredients, 8)),
+                    cooking_time=rng.randint(1, 180))
+             for _ in range(options['recipes'])),
+            batch_size=BATCH_SIZE)
+        RecipeIngredientAmount.objects.bulk_create(
+            (RecipeIngredientAmount(recipe_id=recipe_id, ingredient_id=pk,
+                                    amount=rng.randint(1, 500))
+             for recipe_id in Recipe.objects.filter(
+                 author=author).values_list('id', flat=True).iterator()
+             for pk, _ in rng.sample(ingredients,
+                                     options['ingredients_per_recipe'])),
+            batch_size=BATCH_SIZE)
+        queryset = Recipe.objects.filter(author=author)
+        update_search_vector(queryset)
+        return queryset, [name.split()[0] for _, name
+                          in rng.sample(ingredients, options['repeat'])]
+
+    def measure(self, search, queryset, queries):
+        timings = []
+        for query in queries:
+            started = perf_counter()
+            list(search(queryset, query)[:10])
+            timings.append((perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], timings[-1]
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = perf_counter()
+            queryset, queries = self.seed(options)
+            self.stdout.write(
+                f'Создано {options["recipes"]} рецептов за '
+                f'{perf_counter() - started:.1f} с')
+            searches = [('fallback', fallback_search)]
+            if uses_postgres():
+                searches.append(('tsvector', search_recipes))
+            for title, search in searches:
+                median, worst = self.measure(search, queryset, queries)
+                self.stdout.write(
+                    f'{title}: p50 {median:.1f} мс, max {worst:.1f} мс')
+            transaction.set_rollback(True)
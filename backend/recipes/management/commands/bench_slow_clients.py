@@ -0,0 +1,91 @@
+import asyncio
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+from recipes.management.commands.bench_api import percentile
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержки запросов при медленных клиентах, '
+            'занимающих соединения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес запущенного сервера, '
+                                        'например http://localhost:8000')
+        parser.add_argument('--path', default='/api/recipes/')
+        parser.add_argument('--slow', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Пауза между заголовками медленного '
+                                 'клиента')
+        parser.add_argument('--timeout', type=float, default=10)
+
+    async def slow_client(self, host, port, stop):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f'GET / HTTP/1.1\r\nHost: {host}\r\n'.encode())
+        try:
+            while not stop.is_set():
+                writer.write(b'X-Slow: 1\r\n')
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def fetch(self, host, port, path):
+        started = perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'
+                     f'Connection: close\r\n\r\n'.encode())
+        status = (await reader.readline()).split()[1]
+        await reader.read()
+        writer.close()
+        return int(status), (perf_counter() - started) * 1000
+
+    async def measure(self, host, port, path, slow, total, concurrency):
+        stop = asyncio.Event()
+        slow_clients = [asyncio.create_task(self.slow_client(host, port,
+                                                             stop))
+                        for _ in range(slow)]
+        await asyncio.sleep(1)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.fetch(host, port, path), self.timeout)
+                except (ConnectionError, IndexError, asyncio.TimeoutError):
+                    return None, None
+
+        started = perf_counter()
+        results = await asyncio.gather(*(limited() for _ in range(total)))
+        elapsed = perf_counter() - started
+        stop.set()
+        await asyncio.gather(*slow_clients, return_exceptions=True)
+        timings = sorted(timing for status, timing in results
+                         if status == 200)
+        errors = len(results) - len(timings)
+        if not timings:
+            return f'ошибок {errors}'
+        return (f'p50 {percentile(timings, 0.5):.1f} мс, '
+                f'p95 {percentile(timings, 0.95):.1f} мс, '
+                f'p99 {percentile(timings, 0.99):.1f} мс, '
+                f'{len(timings) / elapsed:.1f} rps, ошибок {errors}')
+
+    def handle(self, *args, **options):
+        self.interval = options['interval']
+        self.timeout = options['timeout']
+        url = urlsplit(options['url'])
+        for slow in (0, options['slow']):
+            result = asyncio.run(self.measure(
+                url.hostname, url.port or 80, options['path'], slow,
+                options['requests'], options['concurrency']))
+            self.stdout.write(f'медленных клиентов {slow}: {result}')
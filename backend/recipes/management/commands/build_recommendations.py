@@ -0,0 +1,134 @@
+from time import perf_counter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from scipy import sparse
+
+from foodgram.settings import RECOMMENDATIONS_TOP_K
+from recipes.models import (Favorite, Recipe, RecipeIngredientAmount,
+                            RecipeSimilarity, ShoppingCart)
+
+FEATURE_WEIGHTS = (
+    (Favorite.objects.values_list('recipe_id', 'user_id'), 1.0),
+    (ShoppingCart.objects.values_list('recipe_id', 'user_id'), 0.7),
+    (Recipe.tags.through.objects.values_list('recipe_id', 'tag_id'), 0.3),
+    (RecipeIngredientAmount.objects.values_list(
+        'recipe_id', 'ingredient_id'), 0.5),
+)
+
+
+def feature_matrix(recipe_ids):
+    blocks = []
+    for queryset, weight in FEATURE_WEIGHTS:
+        pairs = np.fromiter(
+            (value for pair in queryset.iterator() for value in pair),
+            dtype=np.int64).reshape(-1, 2)
+        positions = np.searchsorted(recipe_ids, pairs[:, 0])
+        known = (positions < len(recipe_ids)) & (
+            recipe_ids[np.minimum(positions, len(recipe_ids) - 1)]
+            == pairs[:, 0])
+        columns = pairs[known, 1]
+        blocks.append(sparse.csr_matrix(
+            (np.full(len(columns), weight, dtype=np.float32),
+             (positions[known], columns)),
+            shape=(len(recipe_ids), columns.max() + 1 if len(columns) else 1)))
+    matrix = sparse.hstack(blocks, format='csr')
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).astype(np.float32).tocsr()
+
+
+class Command(BaseCommand):
+    help = 'Рассчитывает похожие рецепты для рекомендаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute neighbours for every recipe. '
+                                 'Lists shortened by deleted recipes are '
+                                 'only refilled this way')
+        parser.add_argument('--top-k', type=int,
+                            default=RECOMMENDATIONS_TOP_K)
+        parser.add_argument('--chunk-size', type=int, default=128)
+
+    def changed_recipes(self, full):
+        since = RecipeSimilarity.objects.aggregate(
+            last=Max('computed_at'))['last']
+        recipes = Recipe.objects.all()
+        if not full and since is not None:
+            recipes = recipes.filter(
+                Q(modified__gt=since)
+                | Q(favorites__added_date__gt=since)
+                | Q(shoppingcarts__added_date__gt=since))
+        return np.fromiter(recipes.order_by().values_list(
+            'id', flat=True).distinct(), dtype=np.int64)
+
+    def affected_recipes(self, recipe_ids, changed, reach, top_k):
+        # Строки, где изменённый рецепт уже стоит в соседях, или где он
+        # теперь сильнее самого слабого из top_k соседей
+        listed = np.fromiter(RecipeSimilarity.objects.filter(
+            similar_id__in=changed.tolist()).values_list(
+            'recipe_id', flat=True).distinct(), dtype=np.int64)
+        thresholds = np.zeros(len(recipe_ids), dtype=np.float32)
+        for recipe_id, lowest in RecipeSimilarity.objects.order_by().values(
+                'recipe_id').annotate(
+                lowest=Min('score'), total=Count('id')).filter(
+                total__gte=top_k).values_list('recipe_id', 'lowest'):
+            thresholds[np.searchsorted(recipe_ids, recipe_id)] = lowest
+        return np.setdiff1d(np.union1d(listed, recipe_ids[reach > thresholds]),
+                            changed)
+
+    def recompute(self, matrix, recipe_ids, rows, reach=None):
+        saved = 0
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            scores = matrix[chunk].dot(matrix.T).toarray()
+            scores[np.arange(len(chunk)), chunk] = 0
+            if reach is not None:
+                np.maximum(reach, scores.max(axis=0), out=reach)
+            k = min(self.top_k, scores.shape[1] - 1)
+            if k <= 0:
+                break
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            neighbours = [
+                RecipeSimilarity(recipe_id=int(recipe_ids[row]),
+                                 similar_id=int(recipe_ids[column]),
+                                 score=float(scores[position, column]),
+                                 computed_at=self.computed_at)
+                for position, row in enumerate(chunk)
+                for column in best[position]
+                if scores[position, column] > 0]
+            with transaction.atomic():
+                RecipeSimilarity.objects.filter(
+                    recipe_id__in=recipe_ids[chunk].tolist()).delete()
+                RecipeSimilarity.objects.bulk_create(neighbours)
+            saved += len(neighbours)
+        return saved
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        self.computed_at = timezone.now()
+        self.top_k = options['top_k']
+        self.chunk_size = options['chunk_size']
+        recipe_ids = np.fromiter(Recipe.objects.order_by('id').values_list(
+            'id', flat=True), dtype=np.int64)
+        changed = np.sort(self.changed_recipes(options['full']))
+        if not len(changed):
+            self.stdout.write('Нет изменившихся рецептов')
+            return
+        matrix = feature_matrix(recipe_ids)
+        reach = np.zeros(len(recipe_ids), dtype=np.float32)
+        saved = self.recompute(matrix, recipe_ids,
+                               np.searchsorted(recipe_ids, changed), reach)
+        affected = np.array([], dtype=np.int64)
+        if len(changed) < len(recipe_ids):
+            affected = self.affected_recipes(recipe_ids, changed, reach,
+                                             self.top_k)
+            saved += self.recompute(matrix, recipe_ids,
+                                    np.searchsorted(recipe_ids, affected))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {len(changed)}, затронутых соседей: '
+            f'{len(affected)}, связей: {saved} '
+            f'за {perf_counter() - started:.1f} с'))
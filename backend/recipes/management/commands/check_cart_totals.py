@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.cart_totals import fresh_totals
+from recipes.models import ShoppingCartTotal
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сверяет итоги списков покупок с пересчётом по рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Rewrite mismatching totals')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        expected = fresh_totals()
+        stored = {(user_id, ingredient_id): amount
+                  for user_id, ingredient_id, amount
+                  in ShoppingCartTotal.objects.select_for_update().values_list(
+                      'user_id', 'ingredient_id', 'amount').iterator()}
+        mismatches = {key for key in expected.keys() | stored.keys()
+                      if expected.get(key) != stored.get(key)}
+        for user_id, ingredient_id in sorted(mismatches):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'в таблице {stored.get((user_id, ingredient_id))}, '
+                f'ожидается {expected.get((user_id, ingredient_id))}')
+        if mismatches and options['fix']:
+            ShoppingCartTotal.objects.all().delete()
+            ShoppingCartTotal.objects.bulk_create(
+                (ShoppingCartTotal(user_id=user_id,
+                                   ingredient_id=ingredient_id,
+                                   amount=amount)
+                 for (user_id, ingredient_id), amount in expected.items()),
+                batch_size=1000)
+            User.objects.filter(
+                id__in={user_id for user_id, _ in mismatches}).update(
+                cart_modified=timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений: {len(mismatches)}'
+            + (', исправлено' if mismatches and options['fix'] else '')))
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+
+from foodgram.db import connection_stats
+from recipes.models import Ingredient
+
+
+def query(_):
+    try:
+        started = perf_counter()
+        Ingredient.objects.count()
+        return perf_counter() - started
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Проверяет работу с соединениями БД: курсоры для .iterator(), '
+            'пул и переиспользование соединений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200)
+
+    def iterate(self, title):
+        try:
+            total = sum(1 for _ in Ingredient.objects.values_list(
+                'id', flat=True).iterator(chunk_size=100))
+        except DatabaseError as error:
+            self.stdout.write(self.style.ERROR(f'{title}: {error}'))
+        else:
+            self.stdout.write(f'{title}: прочитано {total}')
+
+    def handle(self, *args, **options):
+        settings = connection.settings_dict
+        self.stdout.write(
+            f'ENGINE={settings["ENGINE"]} '
+            f'CONN_MAX_AGE={settings["CONN_MAX_AGE"]} '
+            f'DISABLE_SERVER_SIDE_CURSORS='
+            f'{settings.get("DISABLE_SERVER_SIDE_CURSORS", False)}')
+        self.iterate('iterator() вне транзакции')
+        with transaction.atomic():
+            self.iterate('iterator() в транзакции')
+        connection.close()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            timings = sorted(executor.map(query, range(options['requests'])))
+        self.stdout.write(
+            f'{options["requests"]} запросов в {options["threads"]} потоках: '
+            f'p50 {timings[len(timings) // 2] * 1000:.1f} мс, '
+            f'max {timings[-1] * 1000:.1f} мс')
+        for name, labels, value in connection_stats():
+            self.stdout.write(f'{name} {labels} {value}')
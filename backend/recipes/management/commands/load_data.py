@@ -1,19 +1,106 @@
 import csv
+import json
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_generation
 from recipes.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[,] \r\n\t':
+                position += 1
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            position = end
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            if buffer[position:].strip():
+                raise CommandError('Некорректный JSON в файле с данными')
+            return
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Path to the CSV file')
+        parser.add_argument('file_path', type=str,
+                            help='Path to the CSV or JSON file')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Show the difference without saving')
+
+    def existing(self, batch):
+        return set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}).values_list(
+            'name', 'measurement_unit'))
 
     def handle(self, *args, **options):
-        with open(options['file_path'], encoding='utf-8') as file:
-            csv_list = csv.reader(file)
-            for row in csv_list:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
+        path = Path(options['file_path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+        dry_run = options['dry_run']
+        processed = new = 0
+        started = perf_counter()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            before = Ingredient.objects.count()
+            for batch in batches(reader(file), options['batch_size']):
+                processed += len(batch)
+                if dry_run:
+                    existing = self.existing(batch)
+                    for row in dict.fromkeys(batch):
+                        if row not in existing:
+                            new += 1
+                            self.stdout.write('+ {} ({})'.format(*row))
+                else:
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in batch],
+                        ignore_conflicts=True)
+                elapsed = perf_counter() - started
+                self.stdout.write(
+                    f'Обработано {processed} строк, '
+                    f'{processed / elapsed:.0f} строк/с')
+            if not dry_run:
+                new = Ingredient.objects.count() - before
+        if new and not dry_run:
+            bump_generation('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет добавлено" if dry_run else "Добавлено"} '
+            f'{new} ингредиентов из {processed} строк'))
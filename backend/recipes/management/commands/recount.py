@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, покупок, рецептов '
+            'и подписчиков')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_related(Favorite, 'recipe'),
+            in_carts_count=count_related(ShoppingCart, 'recipe'))
+        users = User.objects.update(
+            recipes_count=count_related(Recipe, 'author'),
+            followers_count=count_related(Subscription, 'author'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}'))
@@ -0,0 +1,46 @@
+from multiprocessing import get_context
+from time import monotonic, sleep
+
+import django
+from django.core.management.base import BaseCommand
+
+from foodgram.settings import (JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL,
+                               JOB_WORKERS)
+from recipes.jobs import claim_jobs, heartbeat, run_job
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из таблицы Job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=JOB_WORKERS)
+        parser.add_argument('--once', action='store_true',
+                            help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        running = {}
+        beaten = monotonic()
+        with get_context('spawn').Pool(processes,
+                                       initializer=django.setup) as pool:
+            while True:
+                for job_id in [job_id for job_id, result in running.items()
+                               if result.ready()]:
+                    try:
+                        name, status, duration = running.pop(job_id).get()
+                    except Exception as error:
+                        self.stderr.write(f'job {job_id}: {error}')
+                        continue
+                    self.stdout.write(
+                        f'job {job_id} {name}: {status}, {duration:.3f} с')
+                if running and monotonic() - beaten > JOB_HEARTBEAT_INTERVAL:
+                    heartbeat(list(running))
+                    beaten = monotonic()
+                free = processes - len(running)
+                claimed = claim_jobs(free) if free else []
+                for job_id in claimed:
+                    running[job_id] = pool.apply_async(run_job, (job_id,))
+                if not running and options['once']:
+                    return
+                if not claimed:
+                    sleep(JOB_POLL_INTERVAL if not running else 0.05)
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 17:19
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=recipes.storage.HashedImageStorage(), upload_to='recipes/images', verbose_name='Изображение рецепта'),
+        ),
+    ]
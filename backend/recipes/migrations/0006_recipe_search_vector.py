@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 17:21
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_INDEX = (
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING gin (search_vector)'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipe_search_vector_idx'
+FILL_VECTORS = '''
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', coalesce(recipe.name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_recipeingredientamount AS amount
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = amount.ingredient_id
+        WHERE amount.recipe_id = recipe.id), '')), 'B')
+    || setweight(to_tsvector('russian', coalesce(recipe.text, '')), 'C')
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FILL_VECTORS)
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2 on 2026-10-18 17:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата и время изменения'),
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчёта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=models.Index(fields=['recipe', '-score'], name='recipe_similarity_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipesimilarity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'similar'), name='recipe_similarity_unique'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-18 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_totals(apps, schema_editor):
+    RecipeIngredientAmount = apps.get_model('recipes',
+                                            'RecipeIngredientAmount')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    totals = RecipeIngredientAmount.objects.filter(
+        amount__isnull=False).values(
+        'recipe__shoppingcarts__user', 'ingredient').annotate(
+        total=Sum('amount')).filter(
+        recipe__shoppingcarts__user__isnull=False, total__gt=0)
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=row['recipe__shoppingcarts__user'],
+                          ingredient_id=row['ingredient'],
+                          amount=row['total'])
+        for row in totals.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='shopping_cart_total_unique'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
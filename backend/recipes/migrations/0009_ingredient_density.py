@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shopping_cart_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='density',
+            field=models.FloatField(blank=True, null=True, verbose_name='Плотность, г/мл'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний сигнал воркера'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='output',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Файл результата'),
+        ),
+    ]
@@ -1,9 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 
 from foodgram.settings import MAX_LENGTH
+from recipes.storage import image_storage
+from users.models import Subscription
 
 
 User = get_user_model()
@@ -16,11 +21,19 @@ class Ingredient(models.Model):
     measurement_unit = models.CharField(max_length=16,
                                         verbose_name='Единица измерения'
                                         )
+    density = models.FloatField(blank=True,
+                                null=True,
+                                verbose_name='Плотность, г/мл'
+                                )
 
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='ingredient_name_unit_unique')]
 
     def __str__(self):
         return self.name
@@ -57,6 +70,33 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user=None):
+        authors = User.objects.all()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user,
+                                            author=OuterRef('pk'))))
+        return self.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch('recipes',
+                     queryset=RecipeIngredientAmount.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_user_flags(self, user):
+        if user is None or not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -70,6 +110,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images',
+        storage=image_storage,
         blank=True,
         null=True,
         verbose_name='Изображение рецепта'
@@ -94,11 +135,34 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата и время публикации'
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата и время изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx')]
 
     def __str__(self):
         return self.name
@@ -158,6 +222,7 @@ class BaseList(models.Model):
 
 
 class ShoppingCart(BaseList):
+    counter_field = 'in_carts_count'
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -169,6 +234,7 @@ class ShoppingCart(BaseList):
 
 
 class Favorite(BaseList):
+    counter_field = 'favorites_count'
 
     class Meta:
         verbose_name = 'Список избранного'
@@ -177,3 +243,164 @@ class Favorite(BaseList):
             models.UniqueConstraint(
                 fields=('recipe', 'user'),
                 name='favorite_recipe_unique')]
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='cart_totals'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='cart_totals'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_cart_total_unique')]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
+class RecipeSimilarity(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='neighbours'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='neighbour_of'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='recipe_similarity_unique')]
+        indexes = [
+            models.Index(fields=('recipe', '-score'),
+                         name='recipe_similarity_score_idx')]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=MAX_LENGTH,
+        verbose_name='Задача'
+    )
+    payload = models.JSONField(
+        default=dict,
+        verbose_name='Параметры'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Пользователь',
+        related_name='jobs'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name='Максимум попыток'
+    )
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Не раньше'
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Результат'
+    )
+    output = models.BinaryField(
+        blank=True,
+        null=True,
+        verbose_name='Файл результата'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начало'
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Последний сигнал воркера'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Окончание'
+    )
+    duration = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Длительность, с'
+    )
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=('status', 'run_after'),
+                         name='job_status_run_after_idx')]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
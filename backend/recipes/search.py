@@ -0,0 +1,63 @@
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Case, F, OuterRef, Q, Subquery, When
+
+from foodgram.settings import SEARCH_CONFIG
+
+NAME_WEIGHT = 3
+TEXT_WEIGHT = 1
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    from recipes.models import RecipeIngredientAmount
+
+    ingredient_names = RecipeIngredientAmount.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')).values('names')
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(ingredient_names), weight='B',
+                           config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG))
+
+
+def update_search_vector(queryset):
+    if uses_postgres():
+        queryset.update(search_vector=search_vector())
+
+
+def search_recipes(queryset, value):
+    if uses_postgres():
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)).order_by(
+            '-rank', '-pub_date')
+    return fallback_search(queryset, value)
+
+
+def fallback_search(queryset, value):
+    terms = re.findall(r'\w+', value.casefold())
+    if not terms:
+        return queryset.none()
+    condition = Q()
+    for term in terms:
+        condition &= (Q(name__icontains=term) | Q(text__icontains=term)
+                      | Q(ingredients__name__icontains=term))
+    candidates = queryset.filter(condition).distinct()
+    ranks = {}
+    for pk, name, text in candidates.values_list('id', 'name', 'text'):
+        name, text = name.casefold(), text.casefold()
+        ranks[pk] = sum(NAME_WEIGHT * name.count(term)
+                        + TEXT_WEIGHT * text.count(term) for term in terms)
+    ordered = sorted(ranks, key=ranks.get, reverse=True)
+    return queryset.filter(id__in=ordered).order_by(Case(
+        *(When(id=pk, then=position) for position, pk in enumerate(ordered)),
+        default=len(ordered)))
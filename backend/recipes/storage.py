@@ -0,0 +1,69 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+from foodgram.settings import IMAGE_RENDITIONS, IMAGE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'renditions'
+
+image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS,
+                                thread_name_prefix='renditions')
+
+
+def rendition_name(name, rendition):
+    directory, filename = os.path.split(name)
+    stem, _ = os.path.splitext(filename)
+    return os.path.join(directory, RENDITIONS_DIR, f'{stem}_{rendition}.webp')
+
+
+@deconstructible
+class HashedImageStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        _, ext = os.path.splitext(filename)
+        name = os.path.join(directory, digest.hexdigest() + ext.lower())
+        if self.exists(name):
+            return name
+        name = super()._save(name, content)
+        image_pool.submit(self.make_renditions, name)
+        return name
+
+    def make_renditions(self, name):
+        try:
+            with self.open(name) as file, Image.open(file) as image:
+                image = image.convert('RGBA' if 'A' in image.getbands()
+                                      else 'RGB')
+                for rendition, size in IMAGE_RENDITIONS.items():
+                    resized = image.copy()
+                    resized.thumbnail(size)
+                    buffer = BytesIO()
+                    resized.save(buffer, 'WEBP', quality=80)
+                    target = rendition_name(name, rendition)
+                    if self.exists(target):
+                        self.delete(target)
+                    super()._save(target, ContentFile(buffer.getvalue()))
+        except Exception:
+            logger.exception('Не удалось подготовить превью для %s', name)
+
+    def rendition_url(self, name, rendition):
+        target = rendition_name(name, rendition)
+        if self.exists(target):
+            return self.url(target)
+        return self.url(name)
+
+
+image_storage = HashedImageStorage()
@@ -0,0 +1,154 @@
+from io import StringIO
+from random import Random
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, Recipe,
+                            RecipeIngredientAmount, RecipeSimilarity,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from recipes.search import fallback_search
+from users.models import User
+
+
+class BuildRecommendationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = Random(1)
+        cls.users = [User.objects.create_user(
+            username=f'user{i}', email=f'user{i}@example.com',
+            password='Pass-w0rd-1') for i in range(5)]
+        tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                                   slug=f'tag{i}') for i in range(3)]
+        ingredients = [Ingredient.objects.create(
+            name=f'Продукт {i}', measurement_unit='г') for i in range(6)]
+        cls.recipes = []
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.users[0], name=f'Рецепт {i}', text='Текст',
+                cooking_time=10)
+            recipe.tags.set(rng.sample(tags, 1))
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                       amount=100)
+                for ingredient in rng.sample(ingredients, 2))
+            cls.recipes.append(recipe)
+        for user in cls.users:
+            for recipe in rng.sample(cls.recipes, 4):
+                Favorite.objects.create(user=user, recipe=recipe)
+            for recipe in rng.sample(cls.recipes, 2):
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        call_command('recount', stdout=StringIO())
+
+    def build(self, *args):
+        call_command('build_recommendations', '--top-k', '3', *args,
+                     stdout=StringIO())
+        return {(row.recipe_id, row.similar_id): round(row.score, 5)
+                for row in RecipeSimilarity.objects.all()}
+
+    def test_incremental_matches_full_rebuild(self):
+        self.build('--full')
+        client = APIClient()
+        user = self.users[1]
+        client.force_authenticate(user)
+        favorite = Favorite.objects.filter(user=user).first()
+        self.assertEqual(client.delete(
+            f'/api/recipes/{favorite.recipe_id}/favorite/').status_code, 204)
+        recipe = Recipe.objects.exclude(shoppingcarts__user=user).first()
+        self.assertEqual(client.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/').status_code, 201)
+        self.assertEqual(self.build(), self.build('--full'))
+
+
+class CartTotalsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            password='Pass-w0rd-1')
+        self.flour = Ingredient.objects.create(name='Мука',
+                                               measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.admin, name='Блины', text='Текст', cooking_time=10)
+        self.amount = RecipeIngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=self.flour, amount=100)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.api.post(self.url).status_code, 201)
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def totals(self):
+        return list(ShoppingCartTotal.objects.filter(
+            user=self.user).values_list('amount', flat=True))
+
+    def test_repeated_delete_is_not_applied_twice(self):
+        self.assertEqual(self.api.delete(self.url).status_code, 204)
+        self.assertEqual(self.api.delete(self.url).status_code, 404)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertEqual(self.totals(), [])
+
+    def test_admin_amount_change(self):
+        response = self.client.post(
+            f'/admin/recipes/recipeingredientamount/{self.amount.id}/change/',
+            {'recipe': self.recipe.id, 'ingredient': self.flour.id,
+             'amount': 250})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [250])
+
+    def test_admin_recipe_delete(self):
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [])
+
+    def test_admin_shopping_cart_delete(self):
+        cart = ShoppingCart.objects.get(user=self.user)
+        response = self.client.post('/admin/recipes/shoppingcart/', {
+            'action': 'delete_selected', '_selected_action': [cart.id],
+            'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [])
+
+
+class RecipeSearchTest(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass-w0rd-1')
+        self.tomato = Ingredient.objects.create(name='tomato',
+                                                measurement_unit='г')
+        self.soup, self.salad, self.pie = (Recipe.objects.create(
+            author=author, name=name, text=text, cooking_time=10)
+            for name, text in (('Tomato soup', 'Soup with tomato'),
+                               ('Green salad', 'Fresh salad'),
+                               ('Apple pie', 'Sweet pie')))
+        RecipeIngredientAmount.objects.create(
+            recipe=self.salad, ingredient=self.tomato, amount=100)
+
+    def search(self, value):
+        return list(fallback_search(Recipe.objects.all(), value))
+
+    def test_fallback_ranks_name_above_text_and_ingredients(self):
+        self.assertEqual(self.search('Tomato'), [self.soup, self.salad])
+        self.assertEqual(self.search('pie sweet'), [self.pie])
+        self.assertEqual(self.search('soup salad'), [])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_fallback_finds_renamed_ingredient(self):
+        self.tomato.name = 'cherry'
+        self.tomato.save()
+        self.assertEqual(self.search('cherry'), [self.salad])
+
+    def test_ingredient_rename_refreshes_search_vector(self):
+        with mock.patch('api.signals.update_search_vector') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tomato.name = 'cherry'
+                self.tomato.save()
+                update.assert_not_called()
+        (queryset,), _ = update.call_args
+        self.assertEqual(list(queryset), [self.salad])
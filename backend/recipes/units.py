@@ -0,0 +1,47 @@
+from itertools import groupby
+
+MASS = 'mass'
+VOLUME = 'volume'
+
+UNITS = {
+    'г': (MASS, 1),
+    'кг': (MASS, 1000),
+    'мл': (VOLUME, 1),
+    'л': (VOLUME, 1000),
+    'капля': (VOLUME, 0.05),
+    'ч. л.': (VOLUME, 5),
+    'ст. л.': (VOLUME, 15),
+    'стакан': (VOLUME, 250),
+}
+
+DISPLAY_UNITS = {
+    MASS: (('кг', 1000), ('г', 1)),
+    VOLUME: (('л', 1000), ('мл', 1)),
+}
+
+
+def to_base(unit, amount, density=None):
+    dimension, factor = UNITS.get(unit, (unit, 1))
+    amount *= factor
+    if dimension == VOLUME and density:
+        return MASS, amount * density
+    return dimension, amount
+
+
+def humanize(dimension, amount):
+    for unit, factor in DISPLAY_UNITS.get(dimension, ((dimension, 1),)):
+        if amount >= factor:
+            break
+    value = round(amount / factor, 2)
+    return int(value) if value == int(value) else value, unit
+
+
+def normalize_totals(rows):
+    for name, group in groupby(rows, key=lambda row: row[0]):
+        totals = {}
+        for _, unit, amount, density in group:
+            dimension, amount = to_base(unit, amount or 0, density)
+            totals[dimension] = totals.get(dimension, 0) + amount
+        for dimension, amount in totals.items():
+            value, unit = humanize(dimension, amount)
+            yield name, unit, value
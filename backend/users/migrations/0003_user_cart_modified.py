@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cart_modified',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Изменение итогов списка покупок'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-18 17:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscription = apps.get_model('users', 'Subscription')
+    User.objects.update(followers_count=Coalesce(Subquery(
+        Subscription.objects.filter(author=OuterRef('pk')).order_by().values(
+            'author').annotate(total=Count('pk')).values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_cart_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_followers_count,
+                             migrations.RunPython.noop),
+    ]
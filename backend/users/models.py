@@ -20,6 +20,22 @@ class User(AbstractUser):
         verbose_name='Адрес электронной почты. Обязательное поле.',
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
+    cart_modified = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Изменение итогов списка покупок'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -31,6 +47,8 @@ class User(AbstractUser):
 
 
 class Subscription(models.Model):
+    counter_field = 'followers_count'
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,